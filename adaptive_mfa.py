@@ -0,0 +1,64 @@
+# Adaptive MFA decision logic, kept free of Flask and Stytch so it can be replayed
+# offline against recorded DFP lookups (see replay.py)
+import itertools
+
+SKIP_MFA = "skip_mfa"
+SMS_MFA = "sms_mfa"
+
+# Policies for Members enrolled in adaptive MFA while DFP lookups are unavailable:
+# challenge everyone, or let a device previously remembered as known skip MFA
+DEGRADED_CHALLENGE = "challenge"
+DEGRADED_TRUST_KNOWN_DEVICES = "trust_known_devices"
+DEGRADED_POLICIES = (DEGRADED_CHALLENGE, DEGRADED_TRUST_KNOWN_DEVICES)
+
+# Verdict actions for which a known device may skip MFA
+DEFAULT_TRUSTED_ACTIONS = frozenset(["ALLOW"])
+
+
+# Decides whether a Member enrolled in adaptive MFA must complete SMS MFA
+# A device skips MFA only if it is known for the Member and DFP trusts its verdict;
+# a failed lookup (verdict_action None) always requires MFA, and so does a device
+# shared by many accounts, even if it is known for this Member
+def decide(
+    verdict_action,
+    is_known_device,
+    trusted_actions=DEFAULT_TRUSTED_ACTIONS,
+    is_shared_device=False,
+):
+    if is_known_device and verdict_action in trusted_actions and not is_shared_device:
+        return SKIP_MFA
+    return SMS_MFA
+
+
+# Decides without a DFP verdict, when lookups are failing and the degraded policy applies
+def decide_degraded(is_known_device, policy=DEGRADED_CHALLENGE):
+    if policy == DEGRADED_TRUST_KNOWN_DEVICES and is_known_device:
+        return SKIP_MFA
+    return SMS_MFA
+
+
+# Column-oriented form of decide() for deciding a whole batch of logins at once
+# is_shared_devices may be left out when no device in the batch is shared
+def decide_batch(
+    verdict_actions,
+    is_known_devices,
+    trusted_actions=DEFAULT_TRUSTED_ACTIONS,
+    is_shared_devices=None,
+):
+    if is_shared_devices is None:
+        is_shared_devices = itertools.repeat(False)
+    return [
+        decide(action, known, trusted_actions, shared)
+        for action, known, shared in zip(
+            verdict_actions, is_known_devices, is_shared_devices
+        )
+    ]
+
+
+# Pulls the fields the decision depends on out of a DFP lookup response
+def lookup_fields(data):
+    if not data:
+        return None, None
+    verdict_action = data.get("verdict", {}).get("action", "")
+    visitor_fingerprint = data.get("fingerprints", {}).get("visitor_fingerprint", None)
+    return verdict_action, visitor_fingerprint
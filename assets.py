@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional, only gzip variants are built without it
+    brotli = None
+
+# Content types worth compressing, images other than SVG are already compressed
+COMPRESSIBLE_TYPES = ("text/", "image/svg+xml", "application/javascript", "application/json")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+# Compiles every template up front and stops Jinja checking the template files
+# for changes on each render, even when the app runs with debug=True
+def precompile_templates(app):
+    app.config["TEMPLATES_AUTO_RELOAD"] = False
+    env = app.jinja_env
+    env.auto_reload = False
+    for name in env.list_templates():
+        env.get_template(name)
+
+
+class _Asset:
+    def __init__(self, content: bytes, content_type: str, etag: str):
+        self.content = content
+        self.content_type = content_type
+        self.etag = etag
+        # encoding -> pre-compressed content, most preferred first
+        self.encoded = {}
+
+
+# Serves the static folder from memory under content-hashed file names
+#
+# At startup every static file is read, hashed and, when compressible, compressed
+# with brotli (if installed) and gzip. url_for("static", filename="css/styles.css")
+# then builds "/static/css/styles.<hash>.css", which is served with a one-year
+# immutable Cache-Control since its content can never change; editing the file
+# changes its URL. Requests for the plain file names still work, via Flask's
+# static file handling.
+class FingerprintedStatic:
+    def __init__(self, app):
+        self._send_static_file = app.view_functions["static"]
+        self._assets = {}
+        self._hashed_names = {}
+        for root, _, files in os.walk(app.static_folder):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                name = os.path.relpath(path, app.static_folder).replace(os.sep, "/")
+                self._load(name, path)
+        app.url_defaults(self._hash_static_url)
+        app.view_functions["static"] = self.send
+
+    def _load(self, name, path):
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.blake2b(content, digest_size=5).hexdigest()
+        base, ext = os.path.splitext(name)
+        hashed_name = f"{base}.{digest}{ext}"
+
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        asset = _Asset(content, content_type, digest)
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            candidates = []
+            if brotli is not None:
+                candidates.append(("br", brotli.compress(content, quality=11)))
+            candidates.append(("gzip", gzip.compress(content, compresslevel=9, mtime=0)))
+            for encoding, encoded in candidates:
+                if len(encoded) < len(content):
+                    asset.encoded[encoding] = encoded
+
+        self._assets[hashed_name] = asset
+        self._hashed_names[name] = hashed_name
+
+    def _hash_static_url(self, endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = self._hashed_names.get(
+                values["filename"], values["filename"]
+            )
+
+    def send(self, filename):
+        asset = self._assets.get(filename)
+        if asset is None:
+            return self._send_static_file(filename=filename)
+
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            "ETag": f'"{asset.etag}"',
+            "Vary": "Accept-Encoding",
+        }
+        if asset.etag in request.if_none_match:
+            return Response(status=304, headers=headers)
+
+        content = asset.content
+        for encoding, encoded in asset.encoded.items():
+            if request.accept_encodings[encoding]:
+                content = encoded
+                headers["Content-Encoding"] = encoding
+                break
+        return Response(content, content_type=asset.content_type, headers=headers)
+
+    # Returns {file name: (hashed name, size, {encoding: compressed size})}
+    def stats(self):
+        return {
+            name: (
+                hashed_name,
+                len(self._assets[hashed_name].content),
+                {k: len(v) for k, v in self._assets[hashed_name].encoded.items()},
+            )
+            for name, hashed_name in self._hashed_names.items()
+        }
@@ -0,0 +1,103 @@
+import logging
+import os
+import queue
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+# Runs side effects that the response doesn't need to wait for (device enrollment,
+# audit records) on a small pool of worker threads
+#
+# The queue holds at most `max_pending` tasks. When it is full, submit() waits up to
+# `put_timeout` seconds for room and then runs the task on the calling thread, which
+# slows callers down to the rate the workers keep up with instead of losing work.
+# shutdown() stops accepting tasks and returns once every queued task has run, and
+# with `workers` set to 0 every task simply runs inline.
+# A process forked from one with a queue (a preloading pre-fork server) starts its own
+# workers on an empty queue; tasks queued in the parent are left to the parent.
+class BackgroundQueue:
+    def __init__(self, workers: int = 4, max_pending: int = 1000, put_timeout: float = 0.05):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self._closed = False
+        self._start()
+        after_fork = weakref.WeakMethod(self._after_fork)
+        os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
+
+    def _start(self):
+        self._queue = queue.Queue(self.max_pending)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.ran_inline = 0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"background-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # Runs in a forked child, which inherits none of the parent's worker threads
+    def _after_fork(self):
+        if not self._closed:
+            self._start()
+
+    def submit(self, fn, *args, **kwargs):
+        task = (fn, args, kwargs)
+        if self._threads and not self._closed:
+            try:
+                self._queue.put(task, timeout=self.put_timeout)
+                return
+            except queue.Full:
+                logger.warning("Background queue full, running task inline")
+        with self._lock:
+            self.ran_inline += 1
+        self._run(task)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is _STOP:
+                return
+            self._run(task)
+
+    def _run(self, task):
+        fn, args, kwargs = task
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Background task %s failed", fn.__name__)
+            with self._lock:
+                self.failed += 1
+        else:
+            with self._lock:
+                self.completed += 1
+
+    def shutdown(self):
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        # Run anything submitted while the workers were stopping
+        while True:
+            try:
+                task = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if task is not _STOP:
+                self._run(task)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "completed": self.completed,
+                "failed": self.failed,
+                "ran_inline": self.ran_inline,
+            }
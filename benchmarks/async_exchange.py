@@ -0,0 +1,116 @@
+# Load benchmark for /exchange/<organization_id>, comparing the upstream calls made
+# one after another (sequential) against the async route overlapping them
+# (concurrent), using local stub upstreams
+#
+# The DFP lookup only overlaps the other calls when the IST's discovered Organizations
+# are already cached, as they are after /authenticate, and show the Member uses
+# adaptive MFA. With a cold IST the Organizations are listed first, so a lookup is
+# never paid for a login that won't use it. Both cases are measured.
+#
+# Usage: python benchmarks/async_exchange.py [--latency 0.05] [--threads 16] [--requests 400]
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import MEMBER_ID, ORGANIZATION_ID, StubStytchAPI, StubTelemetryAPI  # noqa: E402
+
+
+def run(main, client_count, total_requests, cached):
+    latencies = []
+    lock = threading.Lock()
+    remaining = [total_requests]
+
+    def worker():
+        client = main.app.test_client()
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            telemetry_id = str(uuid.uuid4())
+            main.known_devices.add(MEMBER_ID, f"vfp-{telemetry_id}")
+            ist = f"ist-{telemetry_id}"
+            with client.session_transaction() as sess:
+                sess["ist"] = ist
+            if cached:
+                discovered_orgs = main.list_discovered_organizations(ist)
+                main.discovered_orgs_cache.set(ist, discovered_orgs)
+
+            start = time.perf_counter()
+            resp = client.post(
+                f"/exchange/{ORGANIZATION_ID}", headers={"X-Telemetry-ID": telemetry_id}
+            )
+            elapsed = time.perf_counter() - start
+            assert resp.location == "/", resp.location
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(client_count)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / wall,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    args = parser.parse_args()
+
+    stytch_api = StubStytchAPI(latency=args.latency).start()
+    telemetry_api = StubTelemetryAPI(latency=args.latency).start()
+    os.environ.update(
+        {
+            "STYTCH_PROJECT_ID": "project-test-00000000-0000-0000-0000-000000000000",
+            "STYTCH_SECRET": "secret-test-benchmark",
+            "STYTCH_PUBLIC_TOKEN": "public-token-test-benchmark",
+            "ENV": f"{stytch_api.url}/",
+            "DFP_LOOKUP_URL": f"{telemetry_api.url}/v1/fingerprint/lookup",
+            "DFP_POOL_SIZE": str(args.threads * 2),
+            "STYTCH_POOL_SIZE": str(args.threads * 2),
+            "KNOWN_DEVICE_STORE": "memory",
+            "KNOWN_DEVICE_MAX_PER_MEMBER": str(args.requests * 2),
+        }
+    )
+    import logging
+
+    import main as app_main
+
+    logging.disable(logging.WARNING)
+
+    print(f"upstream latency {args.latency * 1000:.0f}ms, {args.threads} threads")
+    print(f"{'IST':>7} {'mode':>12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for cached in (False, True):
+        for concurrent in (False, True):
+            app_main.upstream.concurrent = concurrent
+            result = run(app_main, args.threads, args.requests, cached)
+            print(
+                f"{'cached' if cached else 'cold':>7} "
+                f"{'concurrent' if concurrent else 'sequential':>12} "
+                f"{result['rps']:>8.1f} {result['p50']:>8.1f} {result['p95']:>8.1f}"
+            )
+
+    stytch_api.stop()
+    telemetry_api.stop()
+
+
+if __name__ == "__main__":
+    main()
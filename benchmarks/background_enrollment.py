@@ -0,0 +1,136 @@
+# Checks and times moving known-device enrollment off the /authenticate-mfa-code
+# response path, against local stub upstreams
+#
+# 1. Response latency with enrollment run inline versus on the background queue
+# 2. Eventual consistency: every device enrolled in the background becomes known,
+#    and how long after its response that took
+# 3. Graceful shutdown: with a burst of enrollments still queued, shutdown() returns
+#    only once all of them are enrolled, so no work is lost
+# Exits with status 1 if a check fails.
+#
+# Usage: python benchmarks/background_enrollment.py [--requests 200] [--latency 0.02] [--dfp-latency 0.1]
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import MEMBER_ID, ORGANIZATION_ID, StubStytchAPI, StubTelemetryAPI  # noqa: E402
+
+
+def authenticate(main, client):
+    telemetry_id = str(uuid.uuid4())
+    with client.session_transaction() as sess:
+        sess["ist"] = f"ist-{telemetry_id}"
+    start = time.perf_counter()
+    resp = client.post(
+        "/authenticate-mfa-code",
+        json={"code": "123456", "organization_id": ORGANIZATION_ID},
+        headers={"X-Telemetry-ID": telemetry_id},
+    )
+    elapsed = time.perf_counter() - start
+    assert resp.headers["Location"] == "/", resp.headers
+    return f"vfp-{telemetry_id}", elapsed
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--dfp-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    stytch_api = StubStytchAPI(latency=args.latency).start()
+    telemetry_api = StubTelemetryAPI(latency=args.dfp_latency).start()
+    os.environ.update(
+        STYTCH_PROJECT_ID="project-test-00000000-0000-0000-0000-000000000000",
+        STYTCH_SECRET="secret-test-benchmark",
+        STYTCH_PUBLIC_TOKEN="public-token-test-benchmark",
+        ENV=f"{stytch_api.url}/",
+        DFP_LOOKUP_URL=f"{telemetry_api.url}/v1/fingerprint/lookup",
+        KNOWN_DEVICE_STORE="memory",
+        KNOWN_DEVICE_MAX_PER_MEMBER=str(args.requests * 3),
+        PYTHONWARNINGS="ignore",
+    )
+    import main
+    from background import BackgroundQueue
+
+    logging.disable(logging.WARNING)
+    client = main.app.test_client()
+    failures = 0
+
+    # Records when each device's enrollment finished
+    enrolled_at = {}
+    enroll_device = main.enroll_device
+
+    def timed_enroll_device(member_id, organization_id, telemetry_id):
+        enroll_device(member_id, organization_id, telemetry_id)
+        enrolled_at[f"vfp-{telemetry_id}"] = time.perf_counter()
+
+    main.enroll_device = timed_enroll_device
+
+    print(f"{'enrollment':>11} {'p50 ms':>7} {'p99 ms':>7}")
+    results = {}
+    for mode, workers in (("inline", 0), ("background", 4)):
+        main.background = BackgroundQueue(workers=workers)
+        devices, latencies = [], []
+        for _ in range(args.requests):
+            fingerprint, elapsed = authenticate(main, client)
+            devices.append((fingerprint, time.perf_counter()))
+            latencies.append(elapsed)
+        results[mode] = (main.background, devices)
+        latencies.sort()
+        print(
+            f"{mode:>11} {statistics.median(latencies) * 1e3:>7.1f} "
+            f"{latencies[int(len(latencies) * 0.99) - 1] * 1e3:>7.1f}"
+        )
+
+    # Every background enrollment must become visible
+    background_queue, devices = results["background"]
+    deadline = time.monotonic() + 30
+    while background_queue.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    lags = []
+    missing = 0
+    for fingerprint, responded_at in devices:
+        while not main.known_devices.contains(MEMBER_ID, fingerprint):
+            if time.monotonic() > deadline:
+                missing += 1
+                break
+            time.sleep(0.001)
+        else:
+            lags.append(enrolled_at[fingerprint] - responded_at)
+    failures += missing
+    print(
+        f"eventual consistency: {len(lags)}/{len(devices)} enrolled, lag after response "
+        f"p50 {statistics.median(lags) * 1e3:.0f} ms, max {max(lags) * 1e3:.0f} ms, "
+        f"{missing} missing"
+    )
+
+    # A burst of enrollments queued behind slow lookups must all finish on shutdown
+    main.background = BackgroundQueue(workers=2)
+    telemetry_api.latency = args.dfp_latency * 5
+    devices = [authenticate(main, client)[0] for _ in range(args.requests // 4)]
+    pending = main.background.stats()["pending"]
+    start = time.perf_counter()
+    main.background.shutdown()
+    drained = time.perf_counter() - start
+    lost = sum(not main.known_devices.contains(MEMBER_ID, fp) for fp in devices)
+    failures += lost
+    print(
+        f"graceful shutdown: {pending} tasks pending, drained in {drained * 1e3:.0f} ms, "
+        f"{lost} lost, stats {main.background.stats()}"
+    )
+
+    stytch_api.stop()
+    telemetry_api.stop()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,113 @@
+# Simulates a DFP lookup API outage with the fault-injecting telemetry stub and
+# compares lookup latency with and without the circuit breaker in each phase:
+# healthy, outage (every request slow and failing with a non-JSON 502), and recovery
+#
+# Without the breaker every lookup during the outage waits for its deadline; with
+# it, lookups are skipped once the breaker opens, and resume after a probe succeeds
+#
+# Usage: python benchmarks/dfp_outage.py [--threads 16] [--phase-seconds 3] [--deadline 0.5]
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import StubTelemetryAPI  # noqa: E402
+
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from dfp import FingerprintLookupClient  # noqa: E402
+
+PHASES = (
+    ("healthy", 0.0),
+    ("outage", 1.0),
+    ("recovery", 0.0),
+)
+
+
+def run_phase(client, threads, seconds):
+    latencies = []
+    failed = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+
+    def worker():
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            data = client.lookup(str(uuid.uuid4()))
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if data is None:
+                    failed[0] += 1
+
+    with ThreadPoolExecutor(threads) as pool:
+        for _ in range(threads):
+            pool.submit(worker)
+    return latencies, failed[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--phase-seconds", type=float, default=3.0)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--outage-latency", type=float, default=5.0)
+    parser.add_argument("--deadline", type=float, default=0.5)
+    parser.add_argument("--reset-timeout", type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    telemetry = StubTelemetryAPI(
+        latency=args.latency, fault_latency=args.outage_latency
+    ).start()
+
+    print(
+        f"{'breaker':>8} {'phase':>9} {'lookups':>8} {'failed':>7} {'skipped':>8} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'upstream':>9}  state after"
+    )
+    for use_breaker in (False, True):
+        breaker = None
+        if use_breaker:
+            breaker = CircuitBreaker(failure_threshold=5, reset_timeout=args.reset_timeout)
+        client = FingerprintLookupClient(
+            "project-test",
+            "secret-test",
+            lookup_url=f"{telemetry.url}/v1/fingerprint/lookup",
+            pool_size=args.threads,
+            max_retries=0,
+            deadline=args.deadline,
+            breaker=breaker,
+        )
+        for phase, fault_rate in PHASES:
+            telemetry.fault_rate = fault_rate
+            calls_before = telemetry.calls
+            rejected_before = breaker.rejected if breaker else 0
+            latencies, failed = run_phase(client, args.threads, args.phase_seconds)
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            state = breaker.state if breaker else "-"
+            skipped = breaker.rejected - rejected_before if breaker else 0
+            print(
+                f"{'on' if use_breaker else 'off':>8} {phase:>9} {len(latencies):>8} {failed:>7} {skipped:>8} "
+                f"{p50:>8.1f} {p99:>8.1f} {telemetry.calls - calls_before:>9}  {state}"
+            )
+            if breaker and phase == "outage":
+                # Let the breaker's reset timeout pass so recovery starts with a probe
+                time.sleep(args.reset_timeout)
+        client.close()
+        if breaker:
+            print(f"breaker stats: {breaker.stats()}")
+
+    telemetry.stop()
+
+
+if __name__ == "__main__":
+    main()
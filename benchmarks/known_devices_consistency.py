@@ -0,0 +1,156 @@
+# Consistency check for SharedMemoryKnownDeviceStore across processes
+#
+# Writer processes add devices for their own members and hand each one to their own
+# checker process, which must see it straight away (a device trusted in one worker
+# is known in every other). Reader processes meanwhile call devices() and check that
+# every hash returned was written for that member and that no member exceeds the cap.
+# The table starts tiny so that it's rebuilt and swapped many times during the run.
+# Finally a new store handle checks every member holds exactly its most recent devices.
+# Exits with status 1 if any check fails.
+#
+# Usage: python benchmarks/known_devices_consistency.py [--writers 3] [--members 300] [--adds 3000]
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from known_devices import SharedMemoryKnownDeviceStore, fingerprint_hash  # noqa: E402
+
+MAX_DEVICES = 4
+
+
+def open_store(path):
+    return SharedMemoryKnownDeviceStore(path, max_devices=MAX_DEVICES, capacity=8)
+
+
+def member_devices(writer_id, member, adds):
+    # Devices are added in a fixed order, one new device per add
+    return [f"vfp-{writer_id}-{member}-{n}" for n in range(adds)]
+
+
+def writer(path, writer_id, members, adds, conn):
+    store = open_store(path)
+    rng = random.Random(writer_id)
+    counts = [0] * members
+    failures = 0
+    for _ in range(adds):
+        m = rng.randrange(members)
+        fingerprint = f"vfp-{writer_id}-{m}-{counts[m]}"
+        counts[m] += 1
+        store.add(f"member-{writer_id}-{m}", fingerprint)
+        # Another process must see the device as soon as add() has returned
+        conn.send((f"member-{writer_id}-{m}", fingerprint))
+        if not conn.recv():
+            failures += 1
+    conn.send(None)
+    store.close()
+    return counts, failures
+
+
+def checker(path, conn):
+    store = open_store(path)
+    while True:
+        item = conn.recv()
+        if item is None:
+            break
+        conn.send(store.contains(*item))
+    store.close()
+
+
+def reader(path, writers, members, adds, stop, errors):
+    store = open_store(path)
+    valid = {
+        f"member-{w}-{m}": {
+            f"{fingerprint_hash(fp):016x}" for fp in member_devices(w, m, adds)
+        }
+        for w in range(writers)
+        for m in range(members)
+    }
+    member_ids = list(valid)
+    rng = random.Random(os.getpid())
+    failures = 0
+    while not stop.is_set():
+        member_id = rng.choice(member_ids)
+        devices = store.devices(member_id)
+        if len(devices) > MAX_DEVICES or not set(devices) <= valid[member_id]:
+            failures += 1
+    errors.put(failures)
+
+
+def run_writer(path, writer_id, members, adds, conn, results):
+    results.put((writer_id,) + writer(path, writer_id, members, adds, conn))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=3)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--members", type=int, default=300)
+    parser.add_argument("--adds", type=int, default=3000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "known_devices.shm")
+    open_store(path).close()
+
+    errors = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    procs = [
+        multiprocessing.Process(
+            target=reader, args=(path, args.writers, args.members, args.adds, stop, errors)
+        )
+        for _ in range(args.readers)
+    ]
+    writers = []
+    for w in range(args.writers):
+        writer_conn, checker_conn = multiprocessing.Pipe()
+        procs.append(multiprocessing.Process(target=checker, args=(path, checker_conn)))
+        writers.append(
+            multiprocessing.Process(
+                target=run_writer,
+                args=(path, w, args.members, args.adds, writer_conn, results),
+            )
+        )
+    for p in procs + writers:
+        p.start()
+
+    counts = {}
+    failures = {"read-your-writes": 0}
+    for _ in writers:
+        writer_id, member_counts, writer_failures = results.get()
+        counts[writer_id] = member_counts
+        failures["read-your-writes"] += writer_failures
+    for p in writers:
+        p.join()
+    stop.set()
+    failures["torn-or-foreign"] = sum(errors.get() for _ in range(args.readers))
+    for p in procs:
+        p.join()
+
+    # Every member must now hold exactly its MAX_DEVICES most recently added devices
+    store = open_store(path)
+    final = 0
+    for w, member_counts in counts.items():
+        for m, count in enumerate(member_counts):
+            expected = [
+                f"{fingerprint_hash(fp):016x}"
+                for fp in member_devices(w, m, count)[-MAX_DEVICES:]
+            ]
+            if sorted(store.devices(f"member-{w}-{m}")) != sorted(expected):
+                final += 1
+    failures["final-state"] = final
+    capacity = store._capacity
+    store.close()
+
+    print(f"table capacity after run: {capacity}")
+    for name, count in failures.items():
+        print(f"{name:>17}: {count} failures")
+    return 1 if any(failures.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# Compares the memory used to hold known devices in the original dict of sets
+# against the compact MemoryKnownDeviceStore
+#
+# Usage: python benchmarks/known_devices_memory.py [--members 100000 1000000] [--devices 1]
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from known_devices import MemoryKnownDeviceStore  # noqa: E402
+
+
+def fingerprint(member_index, device_index):
+    return f"vfp_{uuid.UUID(int=member_index * 1000 + device_index).hex}{member_index:032x}"
+
+
+def measure(member_ids, devices_per_member, build):
+    gc.collect()
+    tracemalloc.start()
+    store = build()
+    for i, member_id in enumerate(member_ids):
+        for d in range(devices_per_member):
+            store(member_id, fingerprint(i, d))
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def dict_of_sets():
+    devices = {}
+
+    def build():
+        devices.clear()
+        return lambda member_id, fp: devices.setdefault(member_id, set()).add(fp)
+
+    return build
+
+
+def compact_store():
+    holder = {}
+
+    def build():
+        holder["store"] = MemoryKnownDeviceStore()
+        return holder["store"].add
+
+    return build
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--devices", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'members':>10} {'dict of sets':>16} {'compact':>16} {'ratio':>8}")
+    for n in args.members:
+        # Member IDs are held by both representations, so they are allocated
+        # up front and excluded from the measurement
+        member_ids = [f"member-test-{uuid.UUID(int=i)}" for i in range(n)]
+        baseline = measure(member_ids, args.devices, dict_of_sets())
+        compact = measure(member_ids, args.devices, compact_store())
+        print(
+            f"{n:>10} {baseline / n:>11.1f} B/mbr {compact / n:>11.1f} B/mbr {baseline / compact:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Multi-process benchmark of the known-device stores shared between workers:
+# reader processes call contains() for known and unknown devices (like /exchange)
+# while one writer process keeps adding devices (like /authenticate-mfa-code)
+#
+# Usage: python benchmarks/known_devices_shared.py [--readers 4] [--members 100000] [--seconds 5]
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from known_devices import SharedMemoryKnownDeviceStore, SQLiteKnownDeviceStore  # noqa: E402
+
+TTL = 30 * 24 * 60 * 60
+
+
+def open_store(kind, path):
+    if kind == "shared":
+        return SharedMemoryKnownDeviceStore(path, ttl=TTL)
+    return SQLiteKnownDeviceStore(path, ttl=TTL)
+
+
+def reader(kind, path, members, seconds, start, results):
+    store = open_store(kind, path)
+    rng = random.Random(os.getpid())
+    start.wait()
+    ops = hits = 0
+    stop_at = time.monotonic() + seconds
+    while time.monotonic() < stop_at:
+        for _ in range(100):
+            m = rng.randrange(members)
+            # Half the lookups are for a device that isn't known
+            d = 0 if rng.random() < 0.5 else 1
+            hits += store.contains(f"member-{m}", f"vfp-{m}-{d}")
+        ops += 100
+    store.close()
+    results.put(("read", ops, hits))
+
+
+def writer(kind, path, members, seconds, start, results):
+    store = open_store(kind, path)
+    rng = random.Random(0)
+    start.wait()
+    ops = 0
+    stop_at = time.monotonic() + seconds
+    while time.monotonic() < stop_at:
+        m = rng.randrange(members)
+        store.add(f"member-{m}", f"vfp-{m}-{rng.randrange(2, 1000)}")
+        ops += 1
+    store.close()
+    results.put(("write", ops, 0))
+
+
+def run(kind, path, readers, members, seconds):
+    store = open_store(kind, path)
+    for m in range(members):
+        store.add(f"member-{m}", f"vfp-{m}-0")
+    store.close()
+
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(
+            target=reader, args=(kind, path, members, seconds, start, results)
+        )
+        for _ in range(readers)
+    ]
+    procs.append(
+        multiprocessing.Process(
+            target=writer, args=(kind, path, members, seconds, start, results)
+        )
+    )
+    for p in procs:
+        p.start()
+    start.set()
+    totals = {"read": 0, "write": 0}
+    hits = 0
+    for _ in procs:
+        role, ops, role_hits = results.get()
+        totals[role] += ops
+        hits += role_hits
+    for p in procs:
+        p.join()
+    return totals["read"] / seconds, totals["write"] / seconds, hits / max(totals["read"], 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    print(f"{'store':>7} {'reads/s':>10} {'per reader':>11} {'writes/s':>9} {'hit rate':>9}")
+    for kind in ("sqlite", "shared"):
+        path = os.path.join(tmp, f"known_devices.{kind}")
+        reads, writes, hit_rate = run(kind, path, args.readers, args.members, args.seconds)
+        print(
+            f"{kind:>7} {reads:>10,.0f} {reads / args.readers:>11,.0f} "
+            f"{writes:>9,.0f} {hit_rate:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
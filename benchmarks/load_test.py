@@ -0,0 +1,248 @@
+# Load test for the full login flows, run against local stand-ins for the Stytch
+# B2B API and the DFP telemetry API
+#
+# The app runs in its own process on a threaded werkzeug server. Each virtual
+# user loops through:
+#   /send_magic_link -> /authenticate -> /exchange/<org> -> [/authenticate-mfa-code] -> /
+# reusing its device between iterations so that later logins hit the known-device path
+# (--new-device-rate controls how often it switches to a new device instead)
+#
+# Usage:
+#   python benchmarks/load_test.py --users 32 --duration 30 \
+#       --stytch-latency 0.05 --dfp-latency 0.03 --verdicts ALLOW=90,CHALLENGE=8,BLOCK=2 \
+#       --app-env CONCURRENT_UPSTREAM_CALLS=false
+import argparse
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from stubs import ORGANIZATION_ID, StubStytchAPI, StubTelemetryAPI  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_verdicts(value):
+    verdicts = {}
+    for pair in value.split(","):
+        action, weight = pair.split("=")
+        verdicts[action.strip().upper()] = float(weight)
+    return verdicts
+
+
+def start_app(port, env):
+    code = (
+        "import logging, main; from werkzeug.serving import run_simple; "
+        "logging.disable(logging.WARNING); "
+        f"run_simple('127.0.0.1', {port}, main.app, threaded=True)"
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code],
+        cwd=REPO_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/oops", timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    sys.exit("App did not start, run it by hand to see the error")
+
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.flows = 0
+        self._lock = threading.Lock()
+
+    def record(self, route, elapsed, ok):
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            if not ok:
+                self.errors[route] += 1
+
+    def flow_done(self):
+        with self._lock:
+            self.flows += 1
+
+
+def timed(results, route, fn, expect):
+    start = time.perf_counter()
+    try:
+        resp = fn()
+        ok = expect(resp)
+    except requests.RequestException:
+        resp, ok = None, False
+    results.record(route, time.perf_counter() - start, ok)
+    return resp
+
+
+def virtual_user(base_url, results, stop, new_device_rate):
+    http = requests.Session()
+    telemetry_id = str(uuid.uuid4())
+    while not stop.is_set():
+        if random.random() < new_device_rate:
+            telemetry_id = str(uuid.uuid4())
+        headers = {"X-Telemetry-ID": telemetry_id}
+
+        timed(
+            results,
+            "POST /send_magic_link",
+            lambda: http.post(
+                f"{base_url}/send_magic_link",
+                json={"email": "ada@example.com"},
+                headers=headers,
+                allow_redirects=False,
+            ),
+            lambda r: r.status_code == 302 and r.headers["Location"].endswith("/email_sent"),
+        )
+        timed(
+            results,
+            "GET /authenticate",
+            lambda: http.get(
+                f"{base_url}/authenticate",
+                params={"stytch_token_type": "discovery", "token": "magic-link-token"},
+                allow_redirects=False,
+            ),
+            lambda r: r.status_code == 200,
+        )
+        resp = timed(
+            results,
+            "POST /exchange/<org>",
+            lambda: http.post(
+                f"{base_url}/exchange/{ORGANIZATION_ID}",
+                headers=headers,
+                allow_redirects=False,
+            ),
+            lambda r: r.status_code == 302 and "/oops" not in r.headers["Location"],
+        )
+        if resp is not None and "/mfa-otp-prompt/" in resp.headers.get("Location", ""):
+            timed(
+                results,
+                "POST /authenticate-mfa-code",
+                lambda: http.post(
+                    f"{base_url}/authenticate-mfa-code",
+                    json={"code": "123456", "organization_id": ORGANIZATION_ID},
+                    headers=headers,
+                    allow_redirects=False,
+                ),
+                lambda r: r.status_code == 302 and r.headers["Location"].endswith("/"),
+            )
+        timed(
+            results,
+            "GET /",
+            lambda: http.get(f"{base_url}/", allow_redirects=False),
+            lambda r: r.status_code == 200 and b"Dashboard" in r.content,
+        )
+        results.flow_done()
+        http.get(f"{base_url}/logout", allow_redirects=False)
+
+
+def percentile(sorted_values, p):
+    index = max(0, int(round(p / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def report(results, wall):
+    print(f"\n{results.flows} flows in {wall:.1f}s ({results.flows / wall:.1f} flows/s)\n")
+    print(
+        f"{'route':<28} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    )
+    for route, latencies in results.latencies.items():
+        latencies = sorted(latencies)
+        print(
+            f"{route:<28} {len(latencies):>7} {len(latencies) / wall:>8.1f}"
+            f" {statistics.median(latencies) * 1000:>8.1f}"
+            f" {percentile(latencies, 95) * 1000:>8.1f}"
+            f" {percentile(latencies, 99) * 1000:>8.1f}"
+            f" {results.errors[route]:>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run")
+    parser.add_argument("--stytch-latency", type=float, default=0.05)
+    parser.add_argument("--dfp-latency", type=float, default=0.03)
+    parser.add_argument("--verdicts", type=parse_verdicts, default="ALLOW=90,CHALLENGE=8,BLOCK=2")
+    parser.add_argument("--new-device-rate", type=float, default=0.2)
+    parser.add_argument(
+        "--app-env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="extra environment for the app, e.g. CONCURRENT_UPSTREAM_CALLS=false",
+    )
+    args = parser.parse_args()
+
+    stytch_api = StubStytchAPI(latency=args.stytch_latency).start()
+    telemetry_api = StubTelemetryAPI(latency=args.dfp_latency, verdicts=args.verdicts).start()
+
+    port = free_port()
+    env = {
+        "STYTCH_PROJECT_ID": "project-test-00000000-0000-0000-0000-000000000000",
+        "STYTCH_SECRET": "secret-test-benchmark",
+        "STYTCH_PUBLIC_TOKEN": "public-token-test-benchmark",
+        "ENV": f"{stytch_api.url}/",
+        "DFP_LOOKUP_URL": f"{telemetry_api.url}/v1/fingerprint/lookup",
+        "KNOWN_DEVICE_STORE": "memory",
+        "KNOWN_DEVICE_MAX_PER_MEMBER": "1000000",
+        "PYTHONWARNINGS": "ignore",
+    }
+    env.update(pair.split("=", 1) for pair in args.app_env)
+    app = start_app(port, env)
+
+    print(
+        f"{args.users} users for {args.duration:.0f}s, Stytch latency {args.stytch_latency * 1000:.0f}ms,"
+        f" DFP latency {args.dfp_latency * 1000:.0f}ms, verdicts {args.verdicts}"
+    )
+    results = Results()
+    stop = threading.Event()
+    users = [
+        threading.Thread(
+            target=virtual_user,
+            args=(f"http://127.0.0.1:{port}", results, stop, args.new_device_rate),
+        )
+        for _ in range(args.users)
+    ]
+    start = time.perf_counter()
+    for user in users:
+        user.start()
+    time.sleep(args.duration)
+    stop.set()
+    for user in users:
+        user.join()
+    wall = time.perf_counter() - start
+
+    app.terminate()
+    app.wait()
+    stytch_api.stop()
+    telemetry_api.stop()
+    report(results, wall)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Measures the request latency cost of logging at high volume on a route that logs
+# like the dashboard does: the session line, the member's device count (the list
+# itself is only logged at DEBUG) and a few more info lines per request
+#
+# Compares plain text logging on the request thread (with the messages formatted
+# eagerly by f-strings, and lazily with %-style arguments) against the JSON mode,
+# which formats and writes from a background thread, with and without sampling.
+# Logs go to a file so that every record is really written.
+#
+# Usage: python benchmarks/logging_overhead.py [--requests 5000] [--devices 1000]
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+from structured_logging import configure_json_logging  # noqa: E402
+
+logger = logging.getLogger("logging_benchmark")
+
+
+def make_app(devices):
+    app = Flask(__name__)
+    member_id = "member-test-00000000-0000-0000-0000-000000000000"
+    org_id = "organization-test-00000000-0000-0000-0000-000000000000"
+
+    @app.route("/eager")
+    def eager():
+        logger.info("Active Session Found")
+        logger.info(
+            f"Session Member -- ada@example.com | {member_id} \nSession Org -- Example Org | {org_id}"
+        )
+        logger.info(f"Known Member Devices: {len(devices)}")
+        logger.debug(f"Known Member Devices: {devices}")
+        logger.info(f"Rendering dashboard for {member_id}")
+        return "ok"
+
+    @app.route("/lazy")
+    def lazy():
+        logger.info("Active Session Found")
+        logger.info(
+            "Session Member -- %s | %s \nSession Org -- %s | %s",
+            "ada@example.com",
+            member_id,
+            "Example Org",
+            org_id,
+        )
+        logger.info("Known Member Devices: %d", len(devices))
+        logger.debug("Known Member Devices: %s", devices)
+        logger.info("Rendering dashboard for %s", member_id)
+        return "ok"
+
+    return app
+
+
+def configure_text(stream):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=1000)
+    args = parser.parse_args()
+
+    devices = [f"{i * 2654435761 % 2**64:016x}" for i in range(args.devices)]
+    client = make_app(devices).test_client()
+    modes = (
+        ("text, eager", "/eager", configure_text),
+        ("text, lazy", "/lazy", configure_text),
+        ("json async", "/lazy", lambda s: configure_json_logging(stream=s)),
+        (
+            "json async 10%",
+            "/lazy",
+            lambda s: configure_json_logging(sample_rate=0.1, stream=s),
+        ),
+    )
+
+    print(
+        f"{'mode':>15} {'p50 us':>8} {'p99 us':>8} {'p99.9 us':>9} {'mean us':>8} "
+        f"{'drain ms':>9} {'log MB':>7}"
+    )
+    for name, path, configure in modes:
+        with tempfile.NamedTemporaryFile("w") as log_file:
+            queue_handler = configure(log_file)
+            latencies = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                client.get(path)
+                latencies.append(time.perf_counter() - start)
+            # The background writer may still be catching up with the backlog
+            drain_start = time.perf_counter()
+            if queue_handler is not None:
+                queue_handler.queue.join()
+            drain = time.perf_counter() - drain_start
+            log_file.flush()
+            size = os.path.getsize(log_file.name)
+
+        latencies.sort()
+        print(
+            f"{name:>15} {statistics.median(latencies) * 1e6:>8.0f} "
+            f"{latencies[int(len(latencies) * 0.99) - 1] * 1e6:>8.0f} "
+            f"{latencies[int(len(latencies) * 0.999) - 1] * 1e6:>9.0f} "
+            f"{statistics.mean(latencies) * 1e6:>8.0f} {drain * 1e3:>9.1f} "
+            f"{size / 1e6:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
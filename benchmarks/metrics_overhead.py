@@ -0,0 +1,82 @@
+# Measures the cost of the /metrics instrumentation: the per-operation cost of
+# recording a histogram observation or counter increment, and the end-to-end
+# latency of a template-rendering route with the instrumentation on and off
+#
+# Usage: python benchmarks/metrics_overhead.py [--requests 20000]
+import argparse
+import logging
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault(
+    "STYTCH_PROJECT_ID", "project-test-00000000-0000-0000-0000-000000000000"
+)
+os.environ.setdefault("STYTCH_SECRET", "secret-test-benchmark")
+os.environ.setdefault("STYTCH_PUBLIC_TOKEN", "public-token-test-benchmark")
+os.environ.setdefault("KNOWN_DEVICE_STORE", "memory")
+
+import main  # noqa: E402
+from flask import before_render_template, template_rendered  # noqa: E402
+from metrics import REGISTRY, Counter, Histogram, Registry  # noqa: E402
+
+
+def per_op(number=200_000):
+    registry = Registry()
+    histogram = Histogram("bench_seconds", "bench", registry=registry)
+    counter = Counter("bench_total", "bench", registry=registry)
+    observe = timeit.timeit(
+        lambda: histogram.observe(0.042, route="/", method="GET"), number=number
+    )
+    inc = timeit.timeit(lambda: counter.inc(action="ALLOW"), number=number)
+    return observe / number * 1e6, inc / number * 1e6
+
+
+def request_loop(requests):
+    client = main.app.test_client()
+    for _ in range(200):
+        client.get("/oops")
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get("/oops")
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def set_instrumented(enabled):
+    REGISTRY.enabled = enabled
+    hooks = main.app.before_request_funcs.setdefault(None, [])
+    teardowns = main.app.teardown_request_funcs.setdefault(None, [])
+    if enabled:
+        hooks.append(main.start_request_timer)
+        teardowns.append(main.observe_request_latency)
+        before_render_template.connect(main.start_template_timer, main.app)
+        template_rendered.connect(main.observe_template_latency, main.app)
+    else:
+        hooks.remove(main.start_request_timer)
+        teardowns.remove(main.observe_request_latency)
+        before_render_template.disconnect(main.start_template_timer, main.app)
+        template_rendered.disconnect(main.observe_template_latency, main.app)
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    observe_us, inc_us = per_op()
+    print(f"Histogram.observe: {observe_us:.2f}us/op   Counter.inc: {inc_us:.2f}us/op")
+
+    set_instrumented(False)
+    off = request_loop(args.requests)
+    set_instrumented(True)
+    on = request_loop(args.requests)
+    print(f"GET /oops uninstrumented: {off:.1f}us/req")
+    print(f"GET /oops instrumented:   {on:.1f}us/req  (+{on - off:.1f}us, {100 * (on - off) / off:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,119 @@
+# Checks that Organization settings read through the org settings cache are never
+# stale after this process updates them, against a local stub Stytch API
+#
+# 1. Dashboard: after /enable_jit, the next dashboard render shows JIT provisioning
+#    enabled, even with the session's sessions.authenticate result cached
+# 2. Concurrent reads and updates: reader threads call organization_settings() while
+#    a writer renames the Organization through update_organization(). With a short
+#    TTL, reloads are often in flight across an update. Every read must see the
+#    update that finished most recently before the read started, or a newer one.
+# Reports the cache's hit rate and exits with status 1 if any read is stale.
+#
+# Usage: python benchmarks/org_settings_consistency.py [--updates 200] [--readers 4] [--latency 0.005] [--ttl 0.02]
+import argparse
+import bisect
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import ORGANIZATION_ID, StubStytchAPI  # noqa: E402
+
+
+def version(organization):
+    return int(organization.organization_name.rsplit("v", 1)[1])
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--ttl", type=float, default=0.02)
+    args = parser.parse_args()
+
+    stytch_api = StubStytchAPI(latency=args.latency).start()
+    os.environ.update(
+        STYTCH_PROJECT_ID="project-test-00000000-0000-0000-0000-000000000000",
+        STYTCH_SECRET="secret-test-benchmark",
+        STYTCH_PUBLIC_TOKEN="public-token-test-benchmark",
+        ENV=f"{stytch_api.url}/",
+        KNOWN_DEVICE_STORE="memory",
+        SESSION_AUTH_CACHE_TTL="60",
+        ORG_SETTINGS_CACHE_TTL=str(args.ttl),
+        PYTHONWARNINGS="ignore",
+    )
+    import main
+
+    logging.disable(logging.WARNING)
+    failures = 0
+
+    # The dashboard reflects /enable_jit straight away
+    client = main.app.test_client()
+    with client.session_transaction() as sess:
+        sess["stytch_session_token"] = "session-token-consistency"
+    before = client.get("/").text
+    client.get("/enable_jit")
+    after = client.get("/").text
+    ok = "JIT Provisioning Allowed" not in before and "JIT Provisioning Allowed" in after
+    failures += not ok
+    print(f"dashboard after /enable_jit: {'shows' if ok else 'DOES NOT show'} JIT enabled")
+
+    # Reads racing updates
+    main.update_organization(ORGANIZATION_ID, organization_name="Example Org v0")
+    updated_at = [time.perf_counter()]
+    reads = []
+    stop = threading.Event()
+
+    def reader():
+        rng = random.Random()
+        while not stop.is_set():
+            start = time.perf_counter()
+            organization = main.organization_settings(ORGANIZATION_ID)
+            reads.append((start, version(organization)))
+            time.sleep(rng.random() * args.ttl / 2)
+
+    main.org_settings_cache.clear()
+    stats_before = main.org_settings_cache.stats()
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for i in range(1, args.updates + 1):
+        time.sleep(random.random() * args.ttl)
+        main.update_organization(ORGANIZATION_ID, organization_name=f"Example Org v{i}")
+        updated_at.append(time.perf_counter())
+        # The updating request reads its own write
+        if version(main.organization_settings(ORGANIZATION_ID)) < i:
+            failures += 1
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    stale = 0
+    for start, seen in reads:
+        # The newest update that had finished when the read started
+        finished = bisect.bisect_right(updated_at, start) - 1
+        if seen < finished:
+            stale += 1
+    failures += stale
+    stats = main.org_settings_cache.stats()
+    hits = stats["hits"] - stats_before["hits"]
+    misses = stats["misses"] - stats_before["misses"]
+    coalesced = stats["coalesced"] - stats_before["coalesced"]
+    lookups = hits + misses + coalesced
+    print(
+        f"{len(reads)} reads across {args.updates} updates: {stale} stale; "
+        f"hit rate {hits / lookups:.1%} ({hits} hits, {misses} misses, {coalesced} coalesced)"
+    )
+
+    stytch_api.stop()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
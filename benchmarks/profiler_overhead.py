@@ -0,0 +1,121 @@
+# Measures what the request profiler costs, above all when it isn't profiling
+#
+# 1. The profiler's WSGI wrapper around a trivial app, per request: not installed,
+#    installed with no request selected, and sampling 1 in 1000
+# 2. /exchange/<organization_id> against zero-latency stub upstreams: profiler not
+#    installed, installed but idle, sampling 1 in 100, and profiling every request
+#
+# Usage: python benchmarks/profiler_overhead.py [--requests 2000] [--calls 200000]
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import ORGANIZATION_ID, StubStytchAPI, StubTelemetryAPI  # noqa: E402
+
+
+def wrapper_overhead(calls, directory):
+    from profiler import RequestProfiler
+
+    def app(environ, start_response):
+        return [b""]
+
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/", "HTTP_X_PROFILE": "nope"}
+    idle = RequestProfiler(directory, token="secret")._wrap_wsgi_app(app)
+    sampled = RequestProfiler(
+        directory, token="secret", sample_every=1000
+    )._wrap_wsgi_app(app)
+
+    print(f"{'wsgi wrapper':>22} {'ns/request':>11}")
+    for name, fn in (
+        ("not installed", app),
+        ("installed, idle", idle),
+        ("sampling 1 in 1000", sampled),
+    ):
+        best = min(
+            timeit.repeat(lambda: fn(environ, None), number=calls, repeat=5)
+        )
+        print(f"{name:>22} {best / calls * 1e9:>11.0f}")
+
+
+def exchange_overhead(requests_, directory):
+    stytch_api = StubStytchAPI().start()
+    telemetry_api = StubTelemetryAPI().start()
+    os.environ.update(
+        STYTCH_PROJECT_ID="project-test-00000000-0000-0000-0000-000000000000",
+        STYTCH_SECRET="secret-test-benchmark",
+        STYTCH_PUBLIC_TOKEN="public-token-test-benchmark",
+        ENV=f"{stytch_api.url}/",
+        DFP_LOOKUP_URL=f"{telemetry_api.url}/v1/fingerprint/lookup",
+        KNOWN_DEVICE_STORE="memory",
+        PYTHONWARNINGS="ignore",
+    )
+    import main
+    from profiler import RequestProfiler
+
+    logging.disable(logging.WARNING)
+    client = main.app.test_client()
+
+    def run(headers):
+        latencies = []
+        for _ in range(requests_):
+            telemetry_id = str(uuid.uuid4())
+            with client.session_transaction() as sess:
+                sess["ist"] = f"ist-{telemetry_id}"
+            start = time.perf_counter()
+            client.post(
+                f"/exchange/{ORGANIZATION_ID}",
+                headers={"X-Telemetry-ID": telemetry_id, **headers},
+            )
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    run({})
+    print()
+    print(f"{'/exchange':>22} {'p50 ms':>7} {'p99 ms':>7} {'mean ms':>8} {'profiles':>9}")
+    profiler = None
+    for name, sample_every, headers in (
+        ("not installed", None, {}),
+        ("installed, idle", 0, {}),
+        ("sampling 1 in 100", 100, {}),
+        ("every request", 0, {"X-Profile": "secret"}),
+    ):
+        if sample_every is not None:
+            if profiler is None:
+                profiler = RequestProfiler(directory, token="secret", max_files=50)
+                profiler.install(main.app, main.upstream)
+            profiler.sample_every = sample_every
+        before = profiler.stats()["profiled"] if profiler else 0
+        latencies = sorted(run(headers))
+        profiled = profiler.stats()["profiled"] - before if profiler else 0
+        print(
+            f"{name:>22} {statistics.median(latencies) * 1e3:>7.2f} "
+            f"{latencies[int(len(latencies) * 0.99) - 1] * 1e3:>7.2f} "
+            f"{statistics.mean(latencies) * 1e3:>8.2f} {profiled:>9}"
+        )
+
+    stytch_api.stop()
+    telemetry_api.stop()
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        wrapper_overhead(args.calls, directory)
+        exchange_overhead(args.requests, directory)
+
+
+if __name__ == "__main__":
+    main_()
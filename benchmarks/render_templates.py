@@ -0,0 +1,106 @@
+# Render micro-benchmark for the largest pages: the dashboard (loggedIn.html) with
+# 1000 known devices and the Organization picker (discoveredOrganizations.html) with
+# 1000 discovered Organizations
+#
+# Compares templates reloaded-if-changed on each render (as with debug=True) against
+# precompile_templates(), with and without FingerprintedStatic rewriting static URLs,
+# and reports the pre-compressed static asset sizes
+#
+# Usage: python benchmarks/render_templates.py [--items 1000] [--renders 500]
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask, render_template  # noqa: E402
+
+from assets import FingerprintedStatic, precompile_templates  # noqa: E402
+
+
+def make_app(precompile, fingerprint):
+    app = Flask(
+        "render_benchmark",
+        template_folder=os.path.join(ROOT, "templates"),
+        static_folder=os.path.join(ROOT, "static"),
+    )
+    app.config["TEMPLATES_AUTO_RELOAD"] = True
+    if precompile:
+        precompile_templates(app)
+    if fingerprint:
+        FingerprintedStatic(app)
+    return app
+
+
+def pages(items):
+    member = SimpleNamespace(email_address="ada@example.com", is_admin=True)
+    organization = SimpleNamespace(
+        organization_name="Example Org",
+        organization_slug="example-org",
+        email_jit_provisioning="NOT_ALLOWED",
+        email_allowed_domains=[],
+    )
+    devices = [f"{i * 2654435761 % 2**64:016x}" for i in range(items)]
+    orgs = [
+        SimpleNamespace(
+            organization_id=f"organization-test-{i:036d}", organization_name=f"Org {i}"
+        )
+        for i in range(items)
+    ]
+    return {
+        "loggedIn.html": dict(
+            member=member, organization=organization, known_devices=devices
+        ),
+        "discoveredOrganizations.html": dict(
+            discovered_organizations=orgs,
+            email_address="ada@example.com",
+            public_token="public-token-test",
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--renders", type=int, default=500)
+    args = parser.parse_args()
+
+    modes = {
+        "auto-reload": (False, False),
+        "precompiled": (True, False),
+        "precompiled+static": (True, True),
+    }
+    print(f"{'mode':>19} {'template':>29} {'startup ms':>11} {'first ms':>9} {'us/render':>10}")
+    for mode, (precompile, fingerprint) in modes.items():
+        for template, context in pages(args.items).items():
+            start = time.perf_counter()
+            app = make_app(precompile, fingerprint)
+            startup = time.perf_counter() - start
+            with app.test_request_context("/"):
+                start = time.perf_counter()
+                html = render_template(template, **context)
+                first = time.perf_counter() - start
+                start = time.perf_counter()
+                for _ in range(args.renders):
+                    render_template(template, **context)
+                per_render = (time.perf_counter() - start) / args.renders
+            print(
+                f"{mode:>19} {template:>29} {startup * 1e3:>11.1f} "
+                f"{first * 1e3:>9.2f} {per_render * 1e6:>10.0f}"
+            )
+    print(f"page size: {len(html):,} bytes")
+
+    print()
+    print(f"{'asset':>16} {'bytes':>7} {'encoded bytes':>24}  url")
+    for name, (hashed_name, size, encoded) in FingerprintedStatic(
+        make_app(False, False)
+    ).stats().items():
+        sizes = ", ".join(f"{k} {v}" for k, v in encoded.items()) or "-"
+        print(f"{name:>16} {size:>7} {sizes:>24}  /static/{hashed_name}")
+
+
+if __name__ == "__main__":
+    main()
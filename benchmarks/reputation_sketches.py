@@ -0,0 +1,162 @@
+# Accuracy and throughput of the device reputation sketches on a synthetic stream of
+# DFP lookups spread evenly over --hours of simulated time
+#
+# Most lookups come from --devices ordinary browsers, each used by one account (a
+# tenth also by a second one). --shared-rate of them come from --shared browsers that
+# each cycle through a pool of 10 to 2000 accounts. Organizations see 5% CHALLENGE
+# verdicts, except one that jumps to 70% for the last two hours.
+#
+# Reports observe() throughput, query latency and the sketches' fixed memory against
+# exact per-fingerprint sets for one window. Accuracy is measured at the end of the
+# stream against the exact distinct accounts for the range the window covers:
+# estimate error for the shared browsers, how many of those at or over the threshold
+# were flagged, and how many ordinary browsers were wrongly flagged
+#
+# Usage: python benchmarks/reputation_sketches.py [--events 10000000] [--width 8192]
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from device_reputation import DeviceReputation  # noqa: E402
+
+CHUNK = 100_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--window", type=float, default=3600)
+    parser.add_argument("--width", type=int, default=8192)
+    parser.add_argument("--precision", type=int, default=5)
+    parser.add_argument("--threshold", type=int, default=50)
+    parser.add_argument("--devices", type=int, default=1_000_000)
+    parser.add_argument("--shared", type=int, default=100)
+    parser.add_argument("--shared-rate", type=float, default=0.05)
+    parser.add_argument("--orgs", type=int, default=200)
+    parser.add_argument("--sample", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    reputation = DeviceReputation(
+        window=args.window,
+        width=args.width,
+        precision=args.precision,
+        shared_threshold=args.threshold,
+    )
+    duration = args.hours * 3600
+    # The time range the window covers once the stream ends
+    slot_seconds = reputation._window.slot_seconds
+    slots = len(reputation._window._slots)
+    window_start = (int(duration // slot_seconds) - slots + 1) * slot_seconds
+    spike_start = duration - 2 * 3600
+    pools = [int(10 * 200 ** rng.random()) for _ in range(args.shared)]
+
+    # Exact distinct accounts per fingerprint and verdicts per Organization, for the
+    # lookups the final window covers
+    exact = {}
+    org_exact = {}
+    observe_time = 0.0
+    observed = 0
+    while observed < args.events:
+        chunk = []
+        for i in range(observed, min(observed + CHUNK, args.events)):
+            now = i * duration / args.events
+            if rng.random() < args.shared_rate:
+                shared = rng.randrange(args.shared)
+                fingerprint = f"vfp-shared-{shared}"
+                account = f"user{rng.randrange(pools[shared])}-{shared}@example.net"
+            else:
+                device = rng.randrange(args.devices)
+                fingerprint = f"vfp-{device}"
+                alt = "-alt" if device % 10 == 0 and rng.random() < 0.5 else ""
+                account = f"user{device}{alt}@example.com"
+            org = f"org-{rng.randrange(args.orgs)}"
+            challenge_rate = 0.7 if org == "org-0" and now >= spike_start else 0.05
+            action = "CHALLENGE" if rng.random() < challenge_rate else "ALLOW"
+            chunk.append((fingerprint, account, action, org, now))
+            if now >= window_start:
+                exact.setdefault(fingerprint, set()).add(account)
+                lookups, challenges = org_exact.get(org, (0, 0))
+                org_exact[org] = (lookups + 1, challenges + (action == "CHALLENGE"))
+        start = time.perf_counter()
+        for fingerprint, account, action, org, now in chunk:
+            reputation.observe(fingerprint, account, action, org, now=now)
+        observe_time += time.perf_counter() - start
+        observed += len(chunk)
+
+    now = duration
+    benign = [fp for fp in exact if not fp.startswith("vfp-shared-")]
+    benign = rng.sample(benign, min(args.sample, len(benign)))
+    start = time.perf_counter()
+    benign_estimates = [reputation.accounts_for(fp, now) for fp in benign]
+    query_time = (time.perf_counter() - start) / len(benign)
+
+    shared = [f"vfp-shared-{i}" for i in range(args.shared) if f"vfp-shared-{i}" in exact]
+    errors = []
+    should_flag = flagged = 0
+    for fp in shared:
+        estimate = reputation.accounts_for(fp, now)
+        true = len(exact[fp])
+        errors.append((estimate - true) / true)
+        if true >= args.threshold:
+            should_flag += 1
+            flagged += estimate >= args.threshold
+    false_flags = sum(
+        estimate >= args.threshold
+        for fp, estimate in zip(benign, benign_estimates)
+        if len(exact[fp]) < args.threshold
+    )
+    overestimate = statistics.mean(
+        estimate - len(exact[fp]) for fp, estimate in zip(benign, benign_estimates)
+    )
+
+    exact_memory = sys.getsizeof(exact) + sum(
+        sys.getsizeof(fp) + sys.getsizeof(accounts) + sum(map(sys.getsizeof, accounts))
+        for fp, accounts in exact.items()
+    )
+    pairs = sum(len(accounts) for accounts in exact.values())
+    stats = reputation.stats(now)
+    print(f"{args.events:,} lookups over {args.hours:g} h, window {args.window:g} s, width {args.width}")
+    print(
+        f"observe: {args.events / observe_time:,.0f} lookups/s "
+        f"({observe_time / args.events * 1e6:.1f} us each), "
+        f"accounts_for: {query_time * 1e6:.0f} us"
+    )
+    print(
+        f"memory: sketches {reputation.memory() / 1e6:.1f} MB (fixed), exact sets for "
+        f"one window {exact_memory / 1e6:.1f} MB ({pairs:,} fingerprint-account pairs)"
+    )
+    print(
+        f"distinct in window: fingerprints {stats['fingerprints']:,} (exact {len(exact):,}), "
+        f"accounts {stats['accounts']:,} "
+        f"(exact {len(set().union(*exact.values())):,})"
+    )
+    errors.sort()
+    print(
+        f"shared fingerprints: error median {statistics.median(errors):+.1%}, "
+        f"p5 {errors[int(len(errors) * 0.05)]:+.1%}, p95 {errors[int(len(errors) * 0.95)]:+.1%}; "
+        f"flagged {flagged}/{should_flag} with >= {args.threshold} accounts"
+    )
+    print(
+        f"ordinary fingerprints: mean overestimate {overestimate:+.1f} accounts, "
+        f"falsely flagged {false_flags}/{len(benign)}"
+    )
+    spiking = [org for org in sorted(org_exact) if reputation.org_challenge_spike(org, now)]
+    lookups, challenges = reputation.org_verdicts("org-0", now)
+    true_lookups, true_challenges = org_exact["org-0"]
+    print(
+        f"org-0 challenge rate: estimated {challenges / lookups:.1%} of {lookups:,}, "
+        f"exact {true_challenges / true_lookups:.1%} of {true_lookups:,}; "
+        f"orgs flagged as spiking: {spiking}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Compares Flask's signed-cookie session with the server-side session stores:
+# the size of the session cookie and the time per request for requests that
+# only read the session and requests that change it
+#
+# Usage: python benchmarks/session_store.py [--requests 5000]
+import argparse
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, session  # noqa: E402
+
+from server_session import (  # noqa: E402
+    MemorySessionStore,
+    ServerSideSessionInterface,
+    SQLiteSessionStore,
+)
+
+
+def make_app(interface):
+    app = Flask(__name__)
+    app.secret_key = "benchmark-secret-key"
+    if interface is not None:
+        app.session_interface = interface
+
+    @app.route("/login")
+    def login():
+        session["ist"] = secrets.token_urlsafe(33)
+        session["stytch_session_token"] = secrets.token_urlsafe(33)
+        return ""
+
+    @app.route("/read")
+    def read():
+        return session.get("stytch_session_token", "")
+
+    @app.route("/write")
+    def write():
+        session["stytch_session_token"] = secrets.token_urlsafe(33)
+        return ""
+
+    return app
+
+
+def per_request(client, path, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(path)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    backends = {
+        "cookie": None,
+        "memory": ServerSideSessionInterface(MemorySessionStore()),
+        "sqlite": ServerSideSessionInterface(
+            SQLiteSessionStore(os.path.join(tmp, "sessions.db"))
+        ),
+    }
+
+    print(f"{'backend':>8} {'cookie bytes':>13} {'read us/req':>12} {'write us/req':>13}")
+    for name, interface in backends.items():
+        client = make_app(interface).test_client()
+        resp = client.get("/login")
+        cookie = resp.headers["Set-Cookie"].split(";", 1)[0]
+        read = per_request(client, "/read", args.requests)
+        write = per_request(client, "/write", args.requests)
+        print(f"{name:>8} {len(cookie):>13} {read:>12.1f} {write:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
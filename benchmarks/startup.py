@@ -0,0 +1,136 @@
+# Startup-time benchmark: the time to import main, and for a freshly started app
+# process, the time until /healthz answers, until /readyz reports ready, and the
+# latency of the first /send_magic_link (the first request to need the Stytch client),
+# with the Stytch client loaded lazily and with PREWARM_UPSTREAM
+#
+# Usage: python benchmarks/startup.py [--runs 5] [--latency 0.02]
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from stubs import StubStytchAPI, StubTelemetryAPI  # noqa: E402
+
+APP_ENV = {
+    "STYTCH_PROJECT_ID": "project-test-00000000-0000-0000-0000-000000000000",
+    "STYTCH_SECRET": "secret-test-benchmark",
+    "STYTCH_PUBLIC_TOKEN": "public-token-test-benchmark",
+    "KNOWN_DEVICE_STORE": "memory",
+    "PYTHONWARNINGS": "ignore",
+}
+
+
+def import_time(module, env):
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, status=200, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == status:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.005)
+    sys.exit(f"{url} did not return {status}, run the app by hand to see the error")
+
+
+def first_request(env):
+    port = free_port()
+    code = (
+        "import logging, main; from werkzeug.serving import run_simple; "
+        "logging.disable(logging.WARNING); "
+        f"run_simple('127.0.0.1', {port}, main.app, threaded=True)"
+    )
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code],
+        cwd=REPO_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(f"{base}/healthz")
+        healthy = time.perf_counter() - start
+        wait_for(f"{base}/readyz")
+        ready = time.perf_counter() - start
+        send_start = time.perf_counter()
+        resp = requests.post(
+            f"{base}/send_magic_link",
+            json={"email": "ada@example.com"},
+            headers={"X-Telemetry-ID": "startup"},
+            allow_redirects=False,
+        )
+        first_send = time.perf_counter() - send_start
+        assert resp.headers.get("Location", "").endswith("/email_sent"), resp.headers
+    finally:
+        proc.terminate()
+        proc.wait()
+    return healthy, ready, first_send
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    stytch_api = StubStytchAPI(latency=args.latency).start()
+    telemetry_api = StubTelemetryAPI(latency=args.latency).start()
+    env = {
+        **APP_ENV,
+        "ENV": f"{stytch_api.url}/",
+        "DFP_LOOKUP_URL": f"{telemetry_api.url}/v1/fingerprint/lookup",
+    }
+
+    def ms(values):
+        return statistics.median(values) * 1000
+
+    print(f"median of {args.runs} runs")
+    for module in ("stytch", "main"):
+        times = [import_time(module, env) for _ in range(args.runs)]
+        print(f"import {module:>7}: {ms(times):7.0f} ms")
+
+    print()
+    print(f"{'mode':>8} {'healthz ms':>11} {'readyz ms':>10} {'first send ms':>14}")
+    for mode, extra in (("lazy", {}), ("prewarm", {"PREWARM_UPSTREAM": "true"})):
+        runs = [first_request({**env, **extra}) for _ in range(args.runs)]
+        healthy, ready, first_send = zip(*runs)
+        print(f"{mode:>8} {ms(healthy):>11.0f} {ms(ready):>10.0f} {ms(first_send):>14.0f}")
+
+    stytch_api.stop()
+    telemetry_api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# Local stand-ins for the Stytch B2B API and the DFP telemetry lookup API
+#
+# Responses are generated from the Stytch SDK's own response models, so the
+# app parses them exactly as it would real API responses. Each server can add
+# a fixed latency to every request to simulate the network round trip.
+import enum
+import json
+import random
+import threading
+import time
+import typing
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pydantic
+from stytch.b2b.models import (
+    discovery_intermediate_sessions,
+    discovery_organizations,
+    magic_links_discovery,
+    magic_links_email_discovery,
+    organizations,
+    otp_sms,
+    sessions,
+)
+
+ORGANIZATION_ID = "organization-test-00000000-0000-0000-0000-000000000000"
+MEMBER_ID = "member-test-00000000-0000-0000-0000-000000000000"
+EMAIL_ADDRESS = "ada@example.com"
+
+
+# Builds a JSON-compatible dict for a pydantic model, filling every required
+# field with a placeholder value and applying the given overrides
+def fake(model, **overrides):
+    data = {}
+    for name, field in model.model_fields.items():
+        if name in overrides:
+            data[name] = overrides[name]
+        elif field.is_required():
+            data[name] = _fake_value(field.annotation)
+    return data
+
+
+def _fake_value(annotation):
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        return _fake_value(args[0])
+    if origin in (list, typing.List):
+        return []
+    if origin in (dict, typing.Dict):
+        return {}
+    if origin is typing.Literal:
+        return typing.get_args(annotation)[0]
+    if isinstance(annotation, type):
+        if issubclass(annotation, pydantic.BaseModel):
+            return fake(annotation)
+        if issubclass(annotation, enum.Enum):
+            return next(iter(annotation)).value
+        if issubclass(annotation, bool):
+            return False
+        if issubclass(annotation, int):
+            return 0
+        if issubclass(annotation, float):
+            return 0.0
+    if annotation is typing.Any:
+        return None
+    if getattr(annotation, "__name__", "") == "datetime":
+        return "2024-01-01T00:00:00Z"
+    return ""
+
+
+def _member():
+    return fake(
+        organizations.Member,
+        organization_id=ORGANIZATION_ID,
+        member_id=MEMBER_ID,
+        email_address=EMAIL_ADDRESS,
+        status="active",
+        mfa_phone_number="+15555550100",
+        mfa_enrolled=True,
+    )
+
+
+# Settings of the fake Organization, changed by organizations.update calls
+ORGANIZATION = {
+    "organization_id": ORGANIZATION_ID,
+    "organization_name": "Example Org",
+    "organization_slug": "example-org",
+    "email_jit_provisioning": "NOT_ALLOWED",
+    "mfa_policy": "OPTIONAL",
+}
+
+
+def _organization():
+    return fake(organizations.Organization, **ORGANIZATION)
+
+
+def _discovered_organization():
+    return {
+        "member_authenticated": True,
+        "organization": _organization(),
+        "membership": {"type": "active_member", "member": _member()},
+    }
+
+
+def _session_response(model):
+    return fake(
+        model,
+        status_code=200,
+        request_id=str(uuid.uuid4()),
+        session_token=f"session-token-{uuid.uuid4()}",
+        member=_member(),
+        organization=_organization(),
+    )
+
+
+STYTCH_ROUTES = {
+    "/v1/b2b/magic_links/email/discovery/send": lambda: fake(
+        magic_links_email_discovery.SendResponse, status_code=200, request_id="r"
+    ),
+    "/v1/b2b/magic_links/discovery/authenticate": lambda: fake(
+        magic_links_discovery.AuthenticateResponse,
+        status_code=200,
+        request_id="r",
+        intermediate_session_token=f"ist-{uuid.uuid4()}",
+        email_address=EMAIL_ADDRESS,
+        discovered_organizations=[_discovered_organization()],
+    ),
+    "/v1/b2b/discovery/organizations": lambda: fake(
+        discovery_organizations.ListResponse,
+        status_code=200,
+        request_id="r",
+        email_address=EMAIL_ADDRESS,
+        discovered_organizations=[_discovered_organization()],
+    ),
+    "/v1/b2b/discovery/intermediate_sessions/exchange": lambda: _session_response(
+        discovery_intermediate_sessions.ExchangeResponse
+    ),
+    "/v1/b2b/otps/sms/send": lambda: fake(
+        otp_sms.SendResponse, status_code=200, request_id="r", member=_member()
+    ),
+    "/v1/b2b/otps/sms/authenticate": lambda: _session_response(
+        otp_sms.AuthenticateResponse
+    ),
+    "/v1/b2b/sessions/authenticate": lambda: _session_response(
+        sessions.AuthenticateResponse
+    ),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def log_message(self, *args):
+        pass
+
+
+class _StytchHandler(_Handler):
+    def _handle(self):
+        body = self._read_body()
+        self.server.stub.record(self.path)
+        time.sleep(self.server.stub.latency)
+        path = urlparse(self.path).path
+        if path.startswith("/v1/b2b/organizations/"):
+            if self.command == "PUT":
+                update = json.loads(body or b"{}")
+                fields = organizations.Organization.model_fields
+                ORGANIZATION.update((k, v) for k, v in update.items() if k in fields)
+            body = fake(
+                organizations.UpdateResponse,
+                status_code=200,
+                request_id="r",
+                organization=_organization(),
+            )
+        elif path in STYTCH_ROUTES:
+            body = STYTCH_ROUTES[path]()
+        else:
+            return self._reply(404, {"status_code": 404, "error_type": "not_found"})
+        self._reply(200, body)
+
+    do_GET = do_POST = do_PUT = _handle
+
+
+class _TelemetryHandler(_Handler):
+    def do_GET(self):
+        stub = self.server.stub
+        stub.record(self.path)
+        time.sleep(stub.latency)
+        if stub.inject_fault():
+            time.sleep(stub.fault_latency)
+            payload = stub.fault_body.encode()
+            self.send_response(stub.fault_status)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        telemetry_id = parse_qs(urlparse(self.path).query).get("telemetry_id", [""])[0]
+        self._reply(
+            200,
+            {
+                "telemetry_id": telemetry_id,
+                "fingerprints": {"visitor_fingerprint": f"vfp-{telemetry_id}"},
+                "verdict": {"action": self.server.stub.pick_verdict()},
+            },
+        )
+
+
+class StubServer:
+    def __init__(self, handler, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.paths = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        # Clients hanging up on slow responses is expected, don't print a traceback for it
+        self._server.handle_error = lambda request, client_address: None
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def record(self, path):
+        with self._lock:
+            self.calls += 1
+            self.paths[urlparse(path).path] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# Fake Stytch B2B API, point the app at it with ENV="<url>/"
+class StubStytchAPI(StubServer):
+    def __init__(self, latency: float = 0.0):
+        super().__init__(_StytchHandler, latency)
+
+
+# Fake DFP lookup API, point the app at it with DFP_LOOKUP_URL="<url>/v1/fingerprint/lookup"
+# verdicts maps verdict actions to their relative weights, e.g. {"ALLOW": 9, "BLOCK": 1}
+#
+# To simulate an outage, set fault_rate to the fraction of requests that fail:
+# they wait fault_latency more seconds, then get fault_status with a non-JSON
+# body, like a proxy in front of an unhealthy API. The fault settings can be
+# changed while the server is running.
+class StubTelemetryAPI(StubServer):
+    def __init__(
+        self,
+        latency: float = 0.0,
+        verdicts=None,
+        fault_rate: float = 0.0,
+        fault_latency: float = 0.0,
+        fault_status: int = 502,
+    ):
+        super().__init__(_TelemetryHandler, latency)
+        verdicts = verdicts or {"ALLOW": 1}
+        self._actions = list(verdicts)
+        self._weights = list(verdicts.values())
+        self.fault_rate = fault_rate
+        self.fault_latency = fault_latency
+        self.fault_status = fault_status
+        self.fault_body = "<html><body><h1>502 Bad Gateway</h1></body></html>"
+
+    def inject_fault(self):
+        return self.fault_rate > 0 and random.random() < self.fault_rate
+
+    def pick_verdict(self):
+        return random.choices(self._actions, self._weights)[0]
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Tracks a load that is currently in progress so that concurrent misses for
+# the same key can wait on it instead of issuing their own upstream call
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+# Bounded, thread-safe LRU cache whose entries expire after a fixed TTL
+# get_or_load() de-duplicates concurrent misses for the same key (single-flight)
+# and never caches a None result, so failed upstream calls are always retried
+# set() and invalidate() also discard any load already in flight for the key, so a
+# value read before an update is never stored over it. add() only fills in a missing
+# entry, for values that came along with another response and may be older than one set()
+class TTLCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_locked(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            value = self._get_locked(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    # Returns the cached value without counting a hit or miss or refreshing its recency
+    def peek(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            return entry[1]
+
+    def set(self, key, value):
+        if value is None:
+            return
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._set_locked(key, value)
+
+    def add(self, key, value):
+        if value is None:
+            return
+        with self._lock:
+            if self._get_locked(key) is None and key not in self._in_flight:
+                self._set_locked(key, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._in_flight.clear()
+            self._entries.clear()
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            call = self._in_flight.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                call = self._in_flight[key] = _InFlight()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = loader()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._in_flight.get(key) is call:
+                    del self._in_flight[key]
+                    if call.error is None and call.value is not None:
+                        self._set_locked(key, call.value)
+            call.done.set()
+
+        return call.value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
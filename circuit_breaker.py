@@ -0,0 +1,79 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+# Stops calling an upstream that keeps failing so request threads don't pile up behind it
+#
+# After `failure_threshold` consecutive failures the breaker opens and calls are
+# rejected without being attempted. Once `reset_timeout` seconds have passed it
+# goes half-open and lets up to `half_open_max_calls` probe calls through: a
+# successful probe closes it again, a failed one reopens it for another
+# `reset_timeout`.
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self._reset_due():
+                return HALF_OPEN
+            return self._state
+
+    def _reset_due(self):
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    # Returns whether a call may be attempted; every allowed call must be
+    # followed by record_success() or record_failure()
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self._reset_due():
+                self._state = HALF_OPEN
+                self._probes = 0
+            if self._state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self.opened += 1
+
+    def stats(self):
+        return {
+            "open": int(self.state != CLOSED),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,320 @@
+import math
+import statistics
+import threading
+import time
+from array import array
+
+# Streaming aggregates over DFP lookup results: how many accounts each
+# VisitorFingerprint is used with and how often each Organization's logins are
+# challenged, over a sliding time window, in memory that doesn't grow with traffic
+#
+# Keys are hashed with Python's hash(), which is randomized per process, so the
+# sketches are only meaningful within the process that built them and callers
+# can't pick keys that collide on purpose
+
+_MASK64 = (1 << 64) - 1
+_POW2 = [2.0**-rank for rank in range(66)]
+
+
+def _hash64(value):
+    return hash(value) & _MASK64
+
+
+# Offsets of a key's counter in each row of a depth x width table, from two halves
+# of one 64-bit hash (Kirsch-Mitzenmacher double hashing)
+def _offsets(h, width, depth):
+    h1 = h & 0xFFFFFFFF
+    h2 = (h >> 32) | 1
+    return [row * width + (h1 + row * h2) % width for row in range(depth)]
+
+
+# HyperLogLog register index and rank (position of the first set bit) for an item hash
+def _register(h, precision):
+    rest = h >> precision
+    return h & ((1 << precision) - 1), (64 - precision) - rest.bit_length() + 1
+
+
+def _hll_estimate(registers):
+    m = len(registers)
+    if m >= 128:
+        alpha = 0.7213 / (1 + 1.079 / m)
+    else:
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+    estimate = alpha * m * m / sum([_POW2[r] for r in registers])
+    if estimate <= 2.5 * m:
+        zeros = registers.count(0)
+        if zeros:
+            estimate = m * math.log(m / zeros)
+    return estimate
+
+
+def _merge_registers(parts):
+    if len(parts) == 1:
+        return parts[0]
+    return bytes(map(max, *parts))
+
+
+# Count-min sketch: estimated counts per key that are never below the true count
+# and over by at most e/width of the total with probability 1 - e^-depth
+class CountMinSketch:
+    def __init__(self, width: int = 1024, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self._counts = array("Q", bytes(8 * width * depth))
+
+    def add(self, key, count: int = 1):
+        counts = self._counts
+        for offset in _offsets(_hash64(key), self.width, self.depth):
+            counts[offset] += count
+
+    def estimate(self, key):
+        counts = self._counts
+        return min(counts[o] for o in _offsets(_hash64(key), self.width, self.depth))
+
+    def memory(self):
+        return self._counts.itemsize * len(self._counts)
+
+    def clear(self):
+        self._counts = array("Q", bytes(8 * self.width * self.depth))
+
+
+# HyperLogLog distinct counter with 2**precision one-byte registers
+# (standard error about 1.04 / sqrt(2**precision))
+class HyperLogLog:
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        index, rank = _register(_hash64(item), self.precision)
+        if self.registers[index] < rank:
+            self.registers[index] = rank
+
+    # Distinct items added to this counter and to any counters in `merge`
+    def count(self, merge=()):
+        return _hll_estimate(
+            _merge_registers([self.registers] + [other.registers for other in merge])
+        )
+
+    def clear(self):
+        self.registers = bytearray(len(self.registers))
+
+
+# Count-min sketch whose cells are small HyperLogLogs: estimates how many distinct
+# items were seen with each key, e.g. accounts per VisitorFingerprint
+# Each cell counts the items of every key hashed to it, so like a count-min sketch
+# it overestimates, by about (distinct key and item pairs) / width per cell, and
+# the lowest of the `depth` cells is used
+class DistinctCountMinSketch:
+    def __init__(self, width: int = 8192, depth: int = 4, precision: int = 5):
+        self.width = width
+        self.depth = depth
+        self.precision = precision
+        self._m = 1 << precision
+        self._registers = bytearray(width * depth * self._m)
+
+    def add(self, key, item):
+        index, rank = _register(_hash64(item), self.precision)
+        registers = self._registers
+        for offset in _offsets(_hash64(key), self.width, self.depth):
+            position = offset * self._m + index
+            if registers[position] < rank:
+                registers[position] = rank
+
+    # Distinct items seen with `key` in this sketch and in any sketches in `merge`,
+    # which must have the same shape
+    # Given the `total` distinct key and item pairs added, each cell's share of the
+    # other keys' pairs is subtracted and the median of the rows is used instead of
+    # the lowest (count-mean-min), which removes most of the overestimate under load
+    def estimate(self, key, merge=(), total=None):
+        m = self._m
+        sketches = [self, *merge]
+        cells = [
+            _hll_estimate(
+                _merge_registers(
+                    [s._registers[offset * m : (offset + 1) * m] for s in sketches]
+                )
+            )
+            for offset in _offsets(_hash64(key), self.width, self.depth)
+        ]
+        if total is None:
+            return min(cells)
+        corrected = sorted(c - (total - c) / (self.width - 1) for c in cells)
+        return max(0.0, min(statistics.median(corrected), min(cells)))
+
+    def memory(self):
+        return len(self._registers)
+
+    def clear(self):
+        self._registers = bytearray(len(self._registers))
+
+
+# Time-sliced ring of aggregates covering the last `window` seconds
+# The window is split into `slots` slices; data lands in the slice for the current
+# time and a slice is cleared when the ring comes back round to it, so queries
+# see between (slots - 1) / slots and all of the last `window` seconds
+class SlidingWindow:
+    def __init__(self, window: float, slots: int, factory):
+        self.slot_seconds = window / slots
+        self._slots = [factory() for _ in range(slots)]
+        self._epoch = None
+
+    def _advance(self, now):
+        epoch = int(now // self.slot_seconds)
+        if self._epoch is None:
+            self._epoch = epoch
+        elif epoch > self._epoch:
+            for step in range(1, min(epoch - self._epoch, len(self._slots)) + 1):
+                self._slots[(self._epoch + step) % len(self._slots)].clear()
+            self._epoch = epoch
+        return epoch
+
+    def current(self, now):
+        return self._slots[self._advance(now) % len(self._slots)]
+
+    def slots(self, now):
+        self._advance(now)
+        return self._slots
+
+
+class _ReputationSlot:
+    def __init__(self, width, depth, precision):
+        self.accounts = DistinctCountMinSketch(width, depth, precision)
+        self.org_lookups = CountMinSketch(1024, depth)
+        self.org_challenges = CountMinSketch(1024, depth)
+        self.fingerprints = HyperLogLog(12)
+        self.account_ids = HyperLogLog(12)
+        self.pairs = HyperLogLog(12)
+
+    def memory(self):
+        return (
+            self.accounts.memory()
+            + self.org_lookups.memory()
+            + self.org_challenges.memory()
+            + len(self.fingerprints.registers)
+            + len(self.account_ids.registers)
+            + len(self.pairs.registers)
+        )
+
+    def clear(self):
+        self.accounts.clear()
+        self.org_lookups.clear()
+        self.org_challenges.clear()
+        self.fingerprints.clear()
+        self.account_ids.clear()
+        self.pairs.clear()
+
+
+# Device reputation over the last `window` seconds of DFP lookups
+#
+# A VisitorFingerprint used with `shared_threshold` or more distinct accounts is
+# shared: one browser signing in as many people is credential stuffing or account
+# sharing, so it shouldn't be trusted as anyone's known device. An Organization
+# with at least `org_min_lookups` lookups of which `org_challenge_rate` or more were
+# CHALLENGE verdicts is spiking. A threshold of 0 turns that check off.
+class DeviceReputation:
+    def __init__(
+        self,
+        window: float = 3600.0,
+        slots: int = 4,
+        width: int = 8192,
+        depth: int = 4,
+        precision: int = 5,
+        shared_threshold: int = 50,
+        org_challenge_rate: float = 0.5,
+        org_min_lookups: int = 20,
+    ):
+        self.shared_threshold = shared_threshold
+        self.org_challenge_rate = org_challenge_rate
+        self.org_min_lookups = org_min_lookups
+        self._window = SlidingWindow(
+            window, slots, lambda: _ReputationSlot(width, depth, precision)
+        )
+        self._lock = threading.Lock()
+        self._pairs = 0.0
+        self._pairs_counted_at = float("-inf")
+        self.observed = 0
+        self.shared_flagged = 0
+        self.org_spike_flagged = 0
+
+    def observe(
+        self, visitor_fingerprint, account, verdict_action, organization_id=None, now=None
+    ):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._window.current(now)
+            self.observed += 1
+            if visitor_fingerprint:
+                slot.fingerprints.add(visitor_fingerprint)
+                if account:
+                    slot.accounts.add(visitor_fingerprint, account)
+                    slot.pairs.add((visitor_fingerprint, account))
+            if account:
+                slot.account_ids.add(account)
+            if organization_id:
+                slot.org_lookups.add(organization_id)
+                if verdict_action == "CHALLENGE":
+                    slot.org_challenges.add(organization_id)
+
+    # Estimated distinct accounts seen with the VisitorFingerprint in the window
+    def accounts_for(self, visitor_fingerprint, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            first, *rest = self._window.slots(now)
+            # Merging the pair counters is much slower than the lookup itself, and
+            # the correction only needs a rough total, so it's recounted once a second
+            if now - self._pairs_counted_at >= 1.0 or now < self._pairs_counted_at:
+                self._pairs = first.pairs.count([s.pairs for s in rest])
+                self._pairs_counted_at = now
+            return first.accounts.estimate(
+                visitor_fingerprint, [s.accounts for s in rest], self._pairs
+            )
+
+    # Estimated lookups and CHALLENGE verdicts for the Organization in the window
+    def org_verdicts(self, organization_id, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slots = self._window.slots(now)
+            lookups = sum(s.org_lookups.estimate(organization_id) for s in slots)
+            challenges = sum(s.org_challenges.estimate(organization_id) for s in slots)
+        return lookups, min(challenges, lookups)
+
+    def is_shared(self, visitor_fingerprint, now=None):
+        if not self.shared_threshold or not visitor_fingerprint:
+            return False
+        shared = self.accounts_for(visitor_fingerprint, now) >= self.shared_threshold
+        if shared:
+            with self._lock:
+                self.shared_flagged += 1
+        return shared
+
+    def org_challenge_spike(self, organization_id, now=None):
+        if not self.org_challenge_rate or not organization_id:
+            return False
+        lookups, challenges = self.org_verdicts(organization_id, now)
+        spiking = (
+            lookups >= self.org_min_lookups
+            and challenges >= self.org_challenge_rate * lookups
+        )
+        if spiking:
+            with self._lock:
+                self.org_spike_flagged += 1
+        return spiking
+
+    # Bytes held by the sketches, which is fixed at construction
+    def memory(self):
+        return sum(slot.memory() for slot in self._window._slots)
+
+    def stats(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            first, *rest = self._window.slots(now)
+            return {
+                "observed": self.observed,
+                "fingerprints": round(
+                    first.fingerprints.count([s.fingerprints for s in rest])
+                ),
+                "accounts": round(first.account_ids.count([s.account_ids for s in rest])),
+                "shared_flagged": self.shared_flagged,
+                "org_spike_flagged": self.org_spike_flagged,
+            }
@@ -0,0 +1,171 @@
+import logging
+import time
+
+import requests
+from urllib3.util.retry import Retry
+from urllib3.util.timeout import Timeout
+
+from circuit_breaker import CLOSED, CircuitBreaker
+from metrics import TimedHTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOOKUP_URL = "https://telemetry.stytch.com/v1/fingerprint/lookup"
+
+_RETRY_STATUSES = (502, 503, 504)
+
+
+# Connection-pooled client for the DFP Fingerprint Lookup API
+# A single instance is shared by every request thread so that lookups reuse
+# keep-alive connections to telemetry.stytch.com instead of paying a fresh
+# TCP+TLS handshake on each login, MFA and magic link request
+#
+# With a `deadline`, a whole lookup takes no longer than that many seconds,
+# retries and backoff included: each attempt only gets the time that's left.
+# With a `breaker`, connection errors, timeouts and 5xx/429 responses count as
+# failures, and while the breaker is open lookups return None without calling
+# the API (see `degraded`)
+class FingerprintLookupClient:
+    def __init__(
+        self,
+        project_id: str,
+        secret: str,
+        lookup_url: str = DEFAULT_LOOKUP_URL,
+        pool_size: int = 10,
+        connect_timeout: float = 2.0,
+        read_timeout: float = 5.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.1,
+        deadline: float = None,
+        breaker: CircuitBreaker = None,
+    ):
+        self.lookup_url = lookup_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.timeout = Timeout(connect=connect_timeout, read=read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # A deadline of 0 or less means no deadline
+        self.deadline = deadline if deadline is not None and deadline > 0 else None
+        self.breaker = breaker
+
+        # Only idempotent GETs are retried, and only on connection errors or
+        # gateway-style responses, with exponential backoff between attempts
+        # With a deadline the retries are made by _get() instead, which can stop
+        # when the deadline is reached
+        retry = Retry(
+            total=max_retries if self.deadline is None else 0,
+            backoff_factor=retry_backoff,
+            status_forcelist=_RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = TimedHTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+
+        # requests.Session is safe to share across threads for this usage:
+        # the adapter's urllib3 pool hands out one connection per thread
+        self.session = requests.Session()
+        self.session.auth = (project_id, secret)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    # Returns the lookup data for a given TelemetryID, or None if the lookup failed
+    def lookup(self, telemetry_id: str):
+        if self.breaker is not None and not self.breaker.allow():
+            logger.debug("Skipping TelemetryID lookup, DFP circuit breaker is open")
+            return None
+
+        # Every call the breaker let through must record an outcome, even one that
+        # raised, or a half-open breaker would keep waiting for its probe
+        upstream_failed = True
+        try:
+            data, upstream_failed = self._lookup(telemetry_id)
+        finally:
+            if self.breaker is not None:
+                if upstream_failed:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+        return data
+
+    # Makes the lookup request, retrying connection errors and gateway responses
+    # for as long as the deadline allows. Read timeouts aren't retried, by then the
+    # deadline is spent
+    def _get(self, telemetry_id: str):
+        params = {"telemetry_id": telemetry_id}
+        if self.deadline is None:
+            return self.session.get(self.lookup_url, params=params, timeout=self.timeout)
+
+        give_up_at = time.monotonic() + self.deadline
+        attempt = 0
+        resp, error = None, None
+        while True:
+            # Checked again after each backoff sleep, which may wake late
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                if error is not None:
+                    raise error
+                if resp is not None:
+                    return resp
+                raise requests.Timeout("DFP lookup deadline exceeded")
+            timeout = Timeout(
+                connect=min(self.connect_timeout, remaining),
+                read=min(self.read_timeout, remaining),
+                total=remaining,
+            )
+            try:
+                resp = self.session.get(self.lookup_url, params=params, timeout=timeout)
+            except requests.ConnectionError as e:
+                resp, error = None, e
+            else:
+                if resp.status_code not in _RETRY_STATUSES:
+                    return resp
+                error = None
+
+            backoff = self.retry_backoff * (2**attempt)
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + backoff >= give_up_at:
+                if error is not None:
+                    raise error
+                return resp
+            if resp is not None:
+                resp.close()
+            time.sleep(backoff)
+
+    # Returns the lookup data (or None) and whether the failure was the API's fault
+    def _lookup(self, telemetry_id: str):
+        try:
+            resp = self._get(telemetry_id)
+        except requests.RequestException as e:
+            logger.error("Error looking up TelemetryID: %s", e)
+            return None, True
+
+        upstream_failed = resp.status_code >= 500 or resp.status_code == 429
+        if resp.status_code != 200:
+            logger.error("Error looking up TelemetryID: %s", _error_message(resp))
+            return None, upstream_failed
+
+        try:
+            return resp.json(), False
+        except ValueError:
+            logger.error("Error looking up TelemetryID: %s", _error_message(resp))
+            return None, True
+
+    # True while the breaker is open and lookups are being skipped
+    @property
+    def degraded(self) -> bool:
+        return self.breaker is not None and self.breaker.state != CLOSED
+
+    def close(self):
+        self.session.close()
+
+
+# Error bodies from proxies and load balancers are often HTML or plain text, not JSON
+def _error_message(resp) -> str:
+    try:
+        message = str(resp.json())
+    except ValueError:
+        message = f"HTTP {resp.status_code} {resp.text[:200]}"
+    return message.replace("\r\n", "").replace("\n", "")
@@ -0,0 +1,593 @@
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import weakref
+from array import array
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Interface for storing the VisitorFingerprints a Member has completed MFA on
+# Every device carries a last-seen timestamp; devices not seen within `ttl`
+# seconds are treated as unknown again (ttl of None or 0 disables expiry)
+# Each member keeps at most `max_devices`, the least recently seen is evicted first
+class KnownDeviceStore:
+    def __init__(self, ttl: float = None, max_devices: int = 10):
+        self.ttl = ttl or None
+        self.max_devices = max_devices
+
+    def _cutoff(self):
+        if self.ttl is None:
+            return None
+        return time.time() - self.ttl
+
+    # Marks a device as known for the member, e.g. after successful MFA
+    def add(self, member_id: str, visitor_fingerprint: str):
+        raise NotImplementedError
+
+    # Refreshes the last-seen timestamp of a device that is already known
+    def touch(self, member_id: str, visitor_fingerprint: str):
+        raise NotImplementedError
+
+    def contains(self, member_id: str, visitor_fingerprint: str) -> bool:
+        raise NotImplementedError
+
+    # Returns the member's unexpired fingerprints, most recently seen first
+    def devices(self, member_id: str) -> list:
+        raise NotImplementedError
+
+    def purge_expired(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+# Hashes a VisitorFingerprint into a fixed-width 64-bit integer
+def fingerprint_hash(visitor_fingerprint: str) -> int:
+    digest = hashlib.blake2b(visitor_fingerprint.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+# Process-local store, lost on restart and not shared between workers
+# To stay small with millions of members, fingerprints are kept as 64-bit hashes
+# in one flat array per member, interleaved with their last-seen timestamps:
+# [hash, last_seen, hash, last_seen, ...]
+# Because only hashes are stored, devices() returns hex digests rather than
+# the original fingerprints
+class MemoryKnownDeviceStore(KnownDeviceStore):
+    def __init__(self, ttl: float = None, max_devices: int = 10):
+        super().__init__(ttl, max_devices)
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _find(member_devices, fingerprint_id):
+        for i in range(0, len(member_devices), 2):
+            if member_devices[i] == fingerprint_id:
+                return i
+        return -1
+
+    def add(self, member_id, visitor_fingerprint):
+        if not visitor_fingerprint:
+            return
+        fingerprint_id = fingerprint_hash(visitor_fingerprint)
+        now = int(time.time())
+        with self._lock:
+            member_devices = self._devices.get(member_id)
+            if member_devices is None:
+                self._devices[member_id] = array("Q", (fingerprint_id, now))
+                return
+
+            i = self._find(member_devices, fingerprint_id)
+            if i >= 0:
+                member_devices[i + 1] = now
+                return
+
+            if len(member_devices) >= 2 * self.max_devices:
+                oldest = min(
+                    range(0, len(member_devices), 2), key=lambda j: member_devices[j + 1]
+                )
+                del member_devices[oldest : oldest + 2]
+            member_devices.extend((fingerprint_id, now))
+
+    def touch(self, member_id, visitor_fingerprint):
+        fingerprint_id = fingerprint_hash(visitor_fingerprint)
+        with self._lock:
+            member_devices = self._devices.get(member_id)
+            if member_devices is None:
+                return
+            i = self._find(member_devices, fingerprint_id)
+            if i >= 0:
+                member_devices[i + 1] = int(time.time())
+
+    def contains(self, member_id, visitor_fingerprint):
+        if not visitor_fingerprint:
+            return False
+        fingerprint_id = fingerprint_hash(visitor_fingerprint)
+        cutoff = self._cutoff()
+        with self._lock:
+            member_devices = self._devices.get(member_id)
+            if member_devices is None:
+                return False
+            i = self._find(member_devices, fingerprint_id)
+            if i < 0:
+                return False
+            last_seen = member_devices[i + 1]
+        return cutoff is None or last_seen >= cutoff
+
+    def devices(self, member_id):
+        cutoff = self._cutoff()
+        with self._lock:
+            member_devices = self._devices.get(member_id)
+            if member_devices is None:
+                return []
+            pairs = [
+                (member_devices[i], member_devices[i + 1])
+                for i in range(0, len(member_devices), 2)
+            ]
+        pairs.sort(key=lambda pair: pair[1], reverse=True)
+        return [
+            f"{fingerprint_id:016x}"
+            for fingerprint_id, last_seen in pairs
+            if cutoff is None or last_seen >= cutoff
+        ]
+
+    def purge_expired(self):
+        cutoff = self._cutoff()
+        if cutoff is None:
+            return
+        with self._lock:
+            for member_id in list(self._devices):
+                member_devices = self._devices[member_id]
+                kept = array("Q")
+                for i in range(0, len(member_devices), 2):
+                    if member_devices[i + 1] >= cutoff:
+                        kept.extend((member_devices[i], member_devices[i + 1]))
+                if kept:
+                    self._devices[member_id] = kept
+                else:
+                    del self._devices[member_id]
+
+
+# SQLite-backed store that survives restarts and is shared by every worker on the host
+# New devices are written immediately; last-seen refreshes are buffered and
+# written in batches since they happen on every known-device login
+class SQLiteKnownDeviceStore(KnownDeviceStore):
+    def __init__(
+        self,
+        path: str,
+        ttl: float = None,
+        max_devices: int = 10,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+    ):
+        super().__init__(ttl, max_devices)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._local = threading.local()
+        self._inherited = []
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS known_devices (
+                member_id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (member_id, fingerprint)
+            ) WITHOUT ROWID
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS known_devices_last_seen ON known_devices (last_seen)"
+        )
+        conn.commit()
+
+    # sqlite3 connections can't be shared across threads or carried across fork(),
+    # so each thread of each process gets its own. A connection inherited from the
+    # parent (e.g. opened at import under a preloading pre-fork server) is kept
+    # open but unused, since closing it would release the parent's file locks
+    def _conn(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            if getattr(local, "conn", None) is not None:
+                self._inherited.append(local.conn)
+            local.conn = None
+            local.pid = os.getpid()
+        if local.conn is None:
+            local.conn = sqlite3.connect(self.path, timeout=5.0)
+            local.conn.execute("PRAGMA synchronous=NORMAL")
+        return local.conn
+
+    def add(self, member_id, visitor_fingerprint):
+        if not visitor_fingerprint:
+            return
+        with self._pending_lock:
+            self._pending.pop((member_id, visitor_fingerprint), None)
+
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO known_devices (member_id, fingerprint, last_seen)
+                VALUES (?, ?, ?)
+                ON CONFLICT (member_id, fingerprint) DO UPDATE SET last_seen = excluded.last_seen
+                """,
+                (member_id, visitor_fingerprint, time.time()),
+            )
+            # Evict the member's least recently seen devices beyond the cap
+            conn.execute(
+                """
+                DELETE FROM known_devices WHERE member_id = ? AND fingerprint NOT IN (
+                    SELECT fingerprint FROM known_devices WHERE member_id = ?
+                    ORDER BY last_seen DESC LIMIT ?
+                )
+                """,
+                (member_id, member_id, self.max_devices),
+            )
+
+    def touch(self, member_id, visitor_fingerprint):
+        with self._pending_lock:
+            self._pending[(member_id, visitor_fingerprint)] = time.time()
+            due = (
+                len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        # Only refresh rows that still exist, a touch never re-adds a purged device
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                """
+                UPDATE known_devices SET last_seen = MAX(last_seen, ?)
+                WHERE member_id = ? AND fingerprint = ?
+                """,
+                [
+                    (last_seen, member_id, fingerprint)
+                    for (member_id, fingerprint), last_seen in pending.items()
+                ],
+            )
+
+    def contains(self, member_id, visitor_fingerprint):
+        row = (
+            self._conn()
+            .execute(
+                "SELECT last_seen FROM known_devices WHERE member_id = ? AND fingerprint = ?",
+                (member_id, visitor_fingerprint),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return False
+        cutoff = self._cutoff()
+        return cutoff is None or row[0] >= cutoff
+
+    def devices(self, member_id):
+        cutoff = self._cutoff()
+        rows = (
+            self._conn()
+            .execute(
+                """
+                SELECT fingerprint FROM known_devices
+                WHERE member_id = ? AND last_seen >= ?
+                ORDER BY last_seen DESC
+                """,
+                (member_id, cutoff if cutoff is not None else 0),
+            )
+            .fetchall()
+        )
+        return [row[0] for row in rows]
+
+    def purge_expired(self):
+        cutoff = self._cutoff()
+        if cutoff is None:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM known_devices WHERE last_seen < ?", (cutoff,))
+
+    def close(self):
+        self.flush()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+            self._local.conn = None
+
+
+_SHM_MAGIC = b"KDSHM001"
+# magic, capacity, used slots, stale flag (set once the file has been replaced)
+_SHM_HEADER = struct.Struct("<8sQQQ")
+_SHM_HEADER_SIZE = 64
+# seq, member hash, fingerprint hash, last seen
+_SHM_SLOT = struct.Struct("<QQQd")
+_SHM_SEQ = struct.Struct("<Q")
+_SHM_MAX_LOAD = 0.75
+# Reads of a slot that stays odd this many times wait for the write lock instead
+_SHM_READ_SPINS = 1000
+
+
+# Store shared by every worker on the host through a memory-mapped file, so a device
+# trusted in one worker is known to the others as soon as add() returns
+#
+# The file is an open-addressing hash table of (member, fingerprint) hash pairs with
+# their last-seen time, probed linearly from the member's hash so that a member's
+# devices sit in one run of slots. Reads take no lock: each slot carries a sequence
+# number that writers make odd while they change the slot, and readers retry any slot
+# whose sequence number was odd or changed while it was read. Writes are serialized
+# across processes with an flock on "<path>.lock", so there is a single writer at a
+# time. A slot left odd by a writer that died part way through is repaired under the
+# write lock by the next reader or writer to come across it. Workers forked after the
+# store is opened get their own lock file, since flock locks are shared by every
+# process holding the same open file. Expired slots are reused in place; when the
+# table gets too full, or purge_expired() finds expired devices, the writer rebuilds
+# it into a new file, swaps it in with os.replace and flags the old one stale so
+# every process reopens it.
+# Like MemoryKnownDeviceStore, devices() returns hex digests of the fingerprints
+class SharedMemoryKnownDeviceStore(KnownDeviceStore):
+    def __init__(
+        self,
+        path: str,
+        ttl: float = None,
+        max_devices: int = 10,
+        capacity: int = 65536,
+        touch_interval: float = 60.0,
+    ):
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryKnownDeviceStore requires fcntl (POSIX)")
+        super().__init__(ttl, max_devices)
+        self.path = path
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._lock_file = open(f"{path}.lock", "a+b")
+        self._writer = None
+        self._mm = None
+        with self._write_lock():
+            if not os.path.exists(path):
+                os.replace(self._create({}, capacity), path)
+            self._open()
+        after_fork = weakref.WeakMethod(self._after_fork)
+        os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
+
+    # Runs in a forked child before any other thread exists: another thread of the
+    # parent may have held the thread locks when it forked
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._writer = None
+        self._lock_file.close()
+        self._lock_file = open(f"{self.path}.lock", "a+b")
+        self._open()
+
+    def _open(self):
+        with open(self.path, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        magic, capacity, _, _ = _SHM_HEADER.unpack_from(mm)
+        if magic != _SHM_MAGIC:
+            raise ValueError(f"{self.path} is not a known-devices table")
+        # Threads still reading the previous mapping keep it alive until they're done
+        self._mm, self._capacity = mm, capacity
+
+    # Returns the current mapping, reopening the file if a writer has replaced it
+    def _table(self):
+        mm = self._mm
+        if _SHM_HEADER.unpack_from(mm)[3]:
+            with self._open_lock:
+                if self._mm is mm:
+                    self._open()
+            mm = self._mm
+        return mm, self._capacity
+
+    # Serializes writers between threads of this process and between processes
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._writer = threading.get_ident()
+            try:
+                yield
+            finally:
+                self._writer = None
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _read(self, mm, i):
+        offset = _SHM_HEADER_SIZE + i * _SHM_SLOT.size
+        while True:
+            for _ in range(_SHM_READ_SPINS):
+                seq, member, fingerprint_id, last_seen = _SHM_SLOT.unpack_from(mm, offset)
+                if not seq & 1 and _SHM_SEQ.unpack_from(mm, offset)[0] == seq:
+                    return member, fingerprint_id, last_seen
+            self._repair(mm, i)
+
+    # Waits for the slot's writer to finish, or if it died part way through, clears the
+    # slot's device while keeping its member hash so the run of slots isn't cut short
+    def _repair(self, mm, i):
+        offset = _SHM_HEADER_SIZE + i * _SHM_SLOT.size
+        if self._writer == threading.get_ident():
+            if _SHM_SEQ.unpack_from(mm, offset)[0] & 1:
+                member = _SHM_SLOT.unpack_from(mm, offset)[1]
+                self._write(mm, i, member, 0, 0.0)
+            return
+        with self._write_lock():
+            self._repair(mm, i)
+
+    @staticmethod
+    def _write(mm, i, member, fingerprint_id, last_seen):
+        offset = _SHM_HEADER_SIZE + i * _SHM_SLOT.size
+        seq = _SHM_SEQ.unpack_from(mm, offset)[0]
+        # An odd seq was left by a writer that died, start from the next even one
+        seq += seq & 1
+        _SHM_SEQ.pack_into(mm, offset, seq + 1)
+        _SHM_SLOT.pack_into(mm, offset, seq + 1, member, fingerprint_id, last_seen)
+        _SHM_SEQ.pack_into(mm, offset, seq + 2)
+
+    # Yields (slot, member, fingerprint, last_seen) along the member's run of slots,
+    # ending with the empty slot that terminates it (member 0), if any
+    def _scan(self, mm, capacity, member):
+        i = member % capacity
+        for _ in range(capacity):
+            slot = self._read(mm, i)
+            yield (i,) + slot
+            if slot[0] == 0:
+                return
+            i = (i + 1) % capacity
+
+    @staticmethod
+    def _member_hash(member_id):
+        # 0 marks an empty slot
+        return fingerprint_hash(member_id) or 1
+
+    def _find(self, member_id, visitor_fingerprint):
+        member = self._member_hash(member_id)
+        fingerprint_id = fingerprint_hash(visitor_fingerprint)
+        mm, capacity = self._table()
+        for i, slot_member, slot_fingerprint, last_seen in self._scan(mm, capacity, member):
+            if slot_member == member and slot_fingerprint == fingerprint_id:
+                return mm, i, last_seen
+        return mm, None, None
+
+    def add(self, member_id, visitor_fingerprint):
+        if not visitor_fingerprint:
+            return
+        member = self._member_hash(member_id)
+        fingerprint_id = fingerprint_hash(visitor_fingerprint)
+        now = time.time()
+        cutoff = self._cutoff()
+        with self._write_lock():
+            mm, capacity = self._table()
+            own, reusable, empty = [], None, None
+            for i, slot_member, slot_fingerprint, last_seen in self._scan(
+                mm, capacity, member
+            ):
+                if slot_member == 0:
+                    empty = i
+                elif slot_member == member:
+                    if slot_fingerprint == fingerprint_id:
+                        self._write(mm, i, member, fingerprint_id, now)
+                        return
+                    own.append((last_seen, i))
+                elif reusable is None and cutoff is not None and last_seen < cutoff:
+                    reusable = i
+
+            # Replace the member's least recently seen device beyond the cap, otherwise
+            # reuse an expired slot in the run before growing it
+            if len(own) >= self.max_devices:
+                self._write(mm, min(own)[1], member, fingerprint_id, now)
+            elif reusable is not None:
+                self._write(mm, reusable, member, fingerprint_id, now)
+            else:
+                self._write(mm, empty, member, fingerprint_id, now)
+                magic, capacity, used, stale = _SHM_HEADER.unpack_from(mm)
+                _SHM_HEADER.pack_into(mm, 0, magic, capacity, used + 1, stale)
+                if used + 1 > capacity * _SHM_MAX_LOAD:
+                    self._rebuild(mm, capacity)
+
+    # last-seen times only need to be roughly current, so recent ones aren't rewritten
+    def touch(self, member_id, visitor_fingerprint):
+        if not visitor_fingerprint:
+            return
+        _, i, last_seen = self._find(member_id, visitor_fingerprint)
+        now = time.time()
+        if i is None or now - last_seen < self.touch_interval:
+            return
+        member = self._member_hash(member_id)
+        fingerprint_id = fingerprint_hash(visitor_fingerprint)
+        with self._write_lock():
+            mm, i, _ = self._find(member_id, visitor_fingerprint)
+            if i is not None:
+                self._write(mm, i, member, fingerprint_id, now)
+
+    def contains(self, member_id, visitor_fingerprint):
+        if not visitor_fingerprint:
+            return False
+        _, i, last_seen = self._find(member_id, visitor_fingerprint)
+        if i is None:
+            return False
+        cutoff = self._cutoff()
+        return cutoff is None or last_seen >= cutoff
+
+    def devices(self, member_id):
+        member = self._member_hash(member_id)
+        cutoff = self._cutoff()
+        mm, capacity = self._table()
+        pairs = [
+            (fingerprint_id, last_seen)
+            for _, slot_member, fingerprint_id, last_seen in self._scan(mm, capacity, member)
+            if slot_member == member
+            and fingerprint_id
+            and (cutoff is None or last_seen >= cutoff)
+        ]
+        pairs.sort(key=lambda pair: pair[1], reverse=True)
+        return [f"{fingerprint_id:016x}" for fingerprint_id, _ in pairs]
+
+    def purge_expired(self):
+        cutoff = self._cutoff()
+        if cutoff is None:
+            return
+        with self._write_lock():
+            mm, capacity = self._table()
+            for i in range(capacity):
+                member, _, last_seen = self._read(mm, i)
+                if member and last_seen < cutoff:
+                    self._rebuild(mm, capacity)
+                    return
+
+    # Copies the live devices into a new table file and swaps it in, must hold the write lock
+    def _rebuild(self, mm, capacity):
+        cutoff = self._cutoff()
+        live = {}
+        for i in range(capacity):
+            member, fingerprint_id, last_seen = self._read(mm, i)
+            if member and fingerprint_id and (cutoff is None or last_seen >= cutoff):
+                live[(member, fingerprint_id)] = last_seen
+        while len(live) > capacity * _SHM_MAX_LOAD / 2:
+            capacity *= 2
+        os.replace(self._create(live, capacity), self.path)
+        magic, old_capacity, used, _ = _SHM_HEADER.unpack_from(mm)
+        _SHM_HEADER.pack_into(mm, 0, magic, old_capacity, used, 1)
+        self._open()
+
+    def _create(self, live, capacity):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w+b") as f:
+            f.truncate(_SHM_HEADER_SIZE + capacity * _SHM_SLOT.size)
+            mm = mmap.mmap(f.fileno(), 0)
+        _SHM_HEADER.pack_into(mm, 0, _SHM_MAGIC, capacity, len(live), 0)
+        for (member, fingerprint_id), last_seen in live.items():
+            i = member % capacity
+            while _SHM_SLOT.unpack_from(mm, _SHM_HEADER_SIZE + i * _SHM_SLOT.size)[1]:
+                i = (i + 1) % capacity
+            self._write(mm, i, member, fingerprint_id, last_seen)
+        mm.flush()
+        mm.close()
+        return tmp
+
+    def close(self):
+        self._lock_file.close()
@@ -0,0 +1,48 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+# Builds a client on first use instead of at import time, then forwards attribute
+# access to it, so `lazy.otps.sms.send(...)` works as it would on the client itself
+class LazyClient:
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._client is not None
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+# Opens up to `connections` keep-alive connections to the host of `url` in the
+# session's pool by making that many requests at once; any response will do
+# Returns the number of requests that got a response
+def warm_connections(session, url, connections, timeout: float = 5.0) -> int:
+    def request():
+        try:
+            session.get(url, timeout=timeout)
+            return True
+        except requests.RequestException as e:
+            logger.warning("Unable to warm connection to %s: %s", url, e)
+            return False
+
+    with ThreadPoolExecutor(connections) as pool:
+        return sum(pool.map(lambda _: request(), range(connections)))
@@ -1,15 +1,51 @@
+import atexit
 import os
 import sys
+import threading
 
 import logging
 from pprint import pformat
+import time
 import dotenv
+import itsdangerous
 import requests
-import stytch
-from stytch.b2b.models.organizations import UpdateRequestOptions
-from stytch.shared.method_options import Authorization
-from flask import Flask, request, url_for, session, redirect, render_template
-from stytch.core.response_base import StytchError
+from flask import (
+    Flask,
+    Response,
+    after_this_request,
+    before_render_template,
+    g,
+    request,
+    url_for,
+    session,
+    redirect,
+    render_template,
+    template_rendered,
+)
+
+import adaptive_mfa
+from assets import FingerprintedStatic, precompile_templates
+from background import BackgroundQueue
+from cache import TTLCache
+from circuit_breaker import CircuitBreaker
+from device_reputation import DeviceReputation
+from dfp import DEFAULT_LOOKUP_URL, FingerprintLookupClient
+from known_devices import (
+    MemoryKnownDeviceStore,
+    SharedMemoryKnownDeviceStore,
+    SQLiteKnownDeviceStore,
+)
+from lazy_client import LazyClient, warm_connections
+from metrics import REGISTRY, Counter, Histogram, TimedHTTPAdapter
+from profiler import RequestProfiler
+from server_session import (
+    MemorySessionStore,
+    ServerSideSessionInterface,
+    SQLiteSessionStore,
+)
+from sms_limiter import SMSRateLimited, SMSSendLimiter
+from structured_logging import configure_json_logging
+from upstream import UpstreamExecutor
 
 # load the .env file
 dotenv.load_dotenv()
@@ -34,32 +70,377 @@ STYTCH_PUBLIC_TOKEN = os.getenv("STYTCH_PUBLIC_TOKEN")
 if STYTCH_PUBLIC_TOKEN is None:
     sys.exit("STYTCH_PUBLIC_TOKEN env variable must be set before running")
 
-stytch_client = stytch.B2BClient(
-    project_id=STYTCH_PROJECT_ID, secret=STYTCH_SECRET, environment=ENV
+# Size the Stytch client's connection pool for the upstream calls the async routes run concurrently
+# Its adapter also records the latency and errors of every stytch_client call for /metrics
+stytch_session = requests.Session()
+stytch_session.mount(
+    "https://",
+    TimedHTTPAdapter(pool_maxsize=int(os.getenv("STYTCH_POOL_SIZE", "32"))),
+)
+stytch_session.mount(
+    "http://",
+    TimedHTTPAdapter(pool_maxsize=int(os.getenv("STYTCH_POOL_SIZE", "32"))),
+)
+
+
+# Stands in for StytchError until the Stytch SDK is loaded, since no StytchError
+# can be raised before then
+class StytchNotLoaded(Exception):
+    pass
+
+
+StytchError = StytchNotLoaded
+
+
+# Importing the Stytch SDK takes most of the app's startup time, so it is only
+# imported, and the client built, when a request first uses stytch_client
+def load_stytch_client():
+    global StytchError
+    import stytch
+    from stytch.core.response_base import StytchError
+
+    return stytch.B2BClient(
+        project_id=STYTCH_PROJECT_ID,
+        secret=STYTCH_SECRET,
+        environment=ENV,
+        sync_session=stytch_session,
+    )
+
+
+stytch_client = LazyClient(load_stytch_client)
+
+# Shared, connection-pooled client for DFP lookups
+# Point DFP_LOOKUP_URL at a local stub server to test without hitting telemetry.stytch.com
+# A lookup, retries included, takes no longer than DFP_DEADLINE seconds (0 for no
+# deadline). After DFP_BREAKER_FAILURES failures in a row lookups are skipped for
+# DFP_BREAKER_RESET seconds, then DFP_BREAKER_PROBES lookups are let through to check
+# whether the API has recovered
+dfp_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("DFP_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("DFP_BREAKER_RESET", "30")),
+    half_open_max_calls=int(os.getenv("DFP_BREAKER_PROBES", "1")),
+)
+dfp_client = FingerprintLookupClient(
+    project_id=STYTCH_PROJECT_ID,
+    secret=STYTCH_SECRET,
+    lookup_url=os.getenv("DFP_LOOKUP_URL", DEFAULT_LOOKUP_URL),
+    pool_size=int(os.getenv("DFP_POOL_SIZE", "10")),
+    connect_timeout=float(os.getenv("DFP_CONNECT_TIMEOUT", "2.0")),
+    read_timeout=float(os.getenv("DFP_READ_TIMEOUT", "5.0")),
+    max_retries=int(os.getenv("DFP_MAX_RETRIES", "2")),
+    retry_backoff=float(os.getenv("DFP_RETRY_BACKOFF", "0.1")),
+    deadline=float(os.getenv("DFP_DEADLINE", "1.5")),
+    breaker=dfp_breaker,
+)
+
+# While the breaker is open, magic links are sent without a verdict and Members
+# enrolled in adaptive MFA are handled by DFP_DEGRADED_POLICY: "challenge" sends
+# everyone an SMS OTP, "trust_known_devices" lets a device remembered by its signed
+# known-device cookie skip MFA if it is still a known device for the Member
+DFP_DEGRADED_POLICY = os.getenv("DFP_DEGRADED_POLICY", adaptive_mfa.DEGRADED_CHALLENGE)
+if DFP_DEGRADED_POLICY not in adaptive_mfa.DEGRADED_POLICIES:
+    sys.exit(
+        f"DFP_DEGRADED_POLICY must be one of {', '.join(adaptive_mfa.DEGRADED_POLICIES)}"
+    )
+
+# A single login calls fingerprint_lookup several times for the same TelemetryID,
+# so lookups are cached briefly and concurrent misses share one upstream request
+dfp_cache = TTLCache(
+    max_size=int(os.getenv("DFP_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("DFP_CACHE_TTL", "30")),
+)
+
+# Thread pool used by the async routes to overlap independent Stytch and DFP calls
+# Set CONCURRENT_UPSTREAM_CALLS to "false" to make them one after another instead
+upstream = UpstreamExecutor(
+    max_workers=int(os.getenv("UPSTREAM_WORKERS", "32")),
+    concurrent=os.getenv("CONCURRENT_UPSTREAM_CALLS", "true").lower() == "true",
+)
+atexit.register(upstream.shutdown)
+
+# Discovered Organizations for each IST, keyed by OrganizationID
+# Filled from discovery authenticate (or the first list call) so the several lookups
+# made during one login don't each re-list the IST's Organizations
+discovered_orgs_cache = TTLCache(
+    max_size=int(os.getenv("DISCOVERED_ORGS_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("DISCOVERED_ORGS_CACHE_TTL", "600")),
+)
+
+# Settings of each Organization (name, MFA policy, JIT provisioning), keyed by
+# OrganizationID and read by the dashboard and the MFA policy check on exchange
+# Seeded from sessions.authenticate responses, which carry the session's Organization
+# Updates made through update_organization() replace the cached settings, so this
+# process never reads its own changes stale; changes made elsewhere (the Stytch
+# dashboard, other workers) show up within ORG_SETTINGS_CACHE_TTL seconds
+org_settings_cache = TTLCache(
+    max_size=int(os.getenv("ORG_SETTINGS_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ORG_SETTINGS_CACHE_TTL", "300")),
+)
+
+# Opt-in: reuse a sessions.authenticate() result for SESSION_AUTH_CACHE_TTL seconds
+# so that dashboard refreshes don't each cost an API round trip
+# A revoked session may keep working locally until its cache entry expires, so keep this short
+# Cache hits are the remote authenticate calls avoided
+SESSION_AUTH_CACHE_TTL = float(os.getenv("SESSION_AUTH_CACHE_TTL", "0"))
+session_auth_cache = None
+if SESSION_AUTH_CACHE_TTL > 0:
+    session_auth_cache = TTLCache(
+        max_size=int(os.getenv("SESSION_AUTH_CACHE_SIZE", "10000")),
+        ttl=SESSION_AUTH_CACHE_TTL,
+    )
+
+# Guards the SMS OTP sends: repeated sends for the same Member, Organization and phone
+# within SMS_COALESCE_WINDOW seconds share one Stytch call, and each Member gets
+# SMS_BURST sends refilled at SMS_RATE_PER_MINUTE before further sends are suppressed
+sms_limiter = SMSSendLimiter(
+    rate_per_minute=float(os.getenv("SMS_RATE_PER_MINUTE", "1")),
+    burst=int(os.getenv("SMS_BURST", "3")),
+    coalesce_window=float(os.getenv("SMS_COALESCE_WINDOW", "10")),
+)
+
+# Aggregates over the last REPUTATION_WINDOW seconds of DFP lookups, in fixed memory
+# A VisitorFingerprint used with REPUTATION_SHARED_THRESHOLD or more email addresses
+# must complete MFA even on a Member's known device, and an Organization with at least
+# REPUTATION_ORG_MIN_LOOKUPS lookups of which REPUTATION_ORG_CHALLENGE_RATE or more were
+# CHALLENGE verdicts is reported as spiking (0 turns either check off)
+# REPUTATION_SKETCH_WIDTH trades memory for accuracy as traffic grows
+reputation = DeviceReputation(
+    window=float(os.getenv("REPUTATION_WINDOW", "3600")),
+    width=int(os.getenv("REPUTATION_SKETCH_WIDTH", "8192")),
+    shared_threshold=int(os.getenv("REPUTATION_SHARED_THRESHOLD", "50")),
+    org_challenge_rate=float(os.getenv("REPUTATION_ORG_CHALLENGE_RATE", "0.5")),
+    org_min_lookups=int(os.getenv("REPUTATION_ORG_MIN_LOOKUPS", "20")),
+)
+
+# Metrics exposed on /metrics, along with the upstream call timings recorded by TimedHTTPAdapter
+route_latency = Histogram(
+    "http_request_seconds", "Time to handle each request, by route and method"
+)
+template_latency = Histogram(
+    "template_render_seconds", "Time to render each template"
+)
+dfp_verdicts = Counter(
+    "dfp_verdicts_total", "DFP verdict actions seen when deciding on a login"
+)
+adaptive_mfa_decisions = Counter(
+    "adaptive_mfa_decisions_total",
+    "Adaptive MFA outcomes: known_device skips MFA, sms_mfa triggers an SMS OTP",
+)
+REGISTRY.register_callback(
+    "cache_events",
+    "Hit, miss, coalesced and eviction counts for the in-process caches",
+    lambda: cache_events(),
+)
+REGISTRY.register_callback(
+    "dfp_circuit_breaker",
+    "DFP lookup circuit breaker: open is 1 while lookups are skipped, opened and rejected are totals",
+    lambda: {(("event", k),): v for k, v in dfp_breaker.stats().items()},
+)
+REGISTRY.register_callback(
+    "device_reputation",
+    "DFP lookups observed, distinct fingerprints and accounts in the reputation window, and logins flagged as shared_flagged or org_spike_flagged",
+    lambda: {(("stat", k),): v for k, v in reputation.stats().items()},
+)
+REGISTRY.register_callback(
+    "sms_sends_suppressed",
+    "SMS OTP sends that didn't reach Stytch: coalesced into a recent send or rate_limited",
+    lambda: {(("reason", k),): v for k, v in sms_limiter.stats().items()},
 )
 
 # create a Flask web app
 app = Flask(__name__)
 
-logging.basicConfig(level=logging.INFO)
+# Set LOG_FORMAT to "json" to write JSON log lines from a background thread instead of
+# plain text on the request thread, keeping LOG_SAMPLE_RATE of the info lines
+# (warnings and errors are always kept) and at most LOG_QUEUE_SIZE waiting to be written
+if os.getenv("LOG_FORMAT", "text") == "json":
+    log_handler = configure_json_logging(
+        level=logging.INFO,
+        sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1.0")),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    )
+    REGISTRY.register_callback(
+        "log_records_discarded",
+        "Log records not written: sampled out, or dropped because the log queue was full",
+        lambda: {
+            (("reason", "sampled"),): log_handler.filters[0].sampled_out,
+            (("reason", "queue_full"),): log_handler.dropped,
+        },
+    )
+else:
+    logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+audit_logger = logging.getLogger("audit")
 app.secret_key = "some-secret-key"
 
-# In-memory array to store known devices
-# MemberID is key, value is array of VisitorFingerprints
-known_devices = {}
+# By default the session (IST and Stytch session token) lives in Flask's signed cookie
+# Set SESSION_STORE to "memory" or "sqlite" to keep it server-side instead, with the
+# cookie only carrying an opaque session ID
+SESSION_STORE = os.getenv("SESSION_STORE", "cookie")
+if SESSION_STORE in ("memory", "sqlite"):
+    if SESSION_STORE == "memory":
+        session_store = MemorySessionStore(
+            max_size=int(os.getenv("SESSION_STORE_SIZE", "100000"))
+        )
+    else:
+        session_store = SQLiteSessionStore(os.getenv("SESSION_DB", "sessions.db"))
+    app.session_interface = ServerSideSessionInterface(
+        session_store, lifetime=float(os.getenv("SESSION_LIFETIME", "86400"))
+    )
+
+# Set PRECOMPILE_TEMPLATES to "true" to compile every template at startup instead of
+# on first use, and skip checking the template files for changes on each render
+if os.getenv("PRECOMPILE_TEMPLATES", "false").lower() == "true":
+    precompile_templates(app)
+
+# Set FINGERPRINT_STATIC to "true" to serve static files from memory, pre-compressed,
+# under content-hashed URLs that browsers may cache indefinitely
+if os.getenv("FINGERPRINT_STATIC", "false").lower() == "true":
+    FingerprintedStatic(app)
+
+# Set PROFILE_DIR to profile requests that send an X-Profile header matching
+# PROFILE_TOKEN, and one in every PROFILE_SAMPLE_EVERY requests (0 for none), sampling
+# their stacks every PROFILE_INTERVAL seconds. Each profile is written to PROFILE_DIR
+# in collapsed-stack format for flamegraph.pl or speedscope, keeping the newest
+# PROFILE_MAX_FILES
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+if PROFILE_DIR:
+    profiler = RequestProfiler(
+        PROFILE_DIR,
+        token=os.getenv("PROFILE_TOKEN"),
+        sample_every=int(os.getenv("PROFILE_SAMPLE_EVERY", "0")),
+        max_files=int(os.getenv("PROFILE_MAX_FILES", "200")),
+        interval=float(os.getenv("PROFILE_INTERVAL", "0.005")),
+    )
+    profiler.install(app, upstream)
+    REGISTRY.register_callback(
+        "requests_profiled",
+        "Requests profiled and written to PROFILE_DIR",
+        lambda: {(): profiler.stats()["profiled"]},
+    )
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.teardown_request
+def observe_request_latency(exc):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        route_latency.observe(
+            time.perf_counter() - start, route=route, method=request.method
+        )
+
+
+def start_template_timer(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+
+def observe_template_latency(sender, template, context, **extra):
+    start = g.pop("template_start", None)
+    if start is not None:
+        template_latency.observe(time.perf_counter() - start, template=template.name)
+
+
+before_render_template.connect(start_template_timer, app)
+template_rendered.connect(observe_template_latency, app)
+
+# Store of known devices: the VisitorFingerprints each MemberID has completed MFA on
+# The default SQLite store is shared by all workers on the host and survives restarts,
+# set KNOWN_DEVICE_STORE to "memory" to keep them in-process only, or to "shared" for a
+# memory-mapped table at KNOWN_DEVICE_SHM that every worker reads without locks or queries
+# Devices not seen for KNOWN_DEVICE_TTL seconds (default 30 days) must complete MFA again
+# Each member keeps at most KNOWN_DEVICE_MAX_PER_MEMBER devices, least recently seen are evicted
+KNOWN_DEVICE_TTL = float(os.getenv("KNOWN_DEVICE_TTL", str(30 * 24 * 60 * 60)))
+KNOWN_DEVICE_MAX_PER_MEMBER = int(os.getenv("KNOWN_DEVICE_MAX_PER_MEMBER", "10"))
+KNOWN_DEVICE_STORE = os.getenv("KNOWN_DEVICE_STORE", "sqlite")
+if KNOWN_DEVICE_STORE == "memory":
+    known_devices = MemoryKnownDeviceStore(
+        ttl=KNOWN_DEVICE_TTL, max_devices=KNOWN_DEVICE_MAX_PER_MEMBER
+    )
+elif KNOWN_DEVICE_STORE == "shared":
+    known_devices = SharedMemoryKnownDeviceStore(
+        os.getenv("KNOWN_DEVICE_SHM", "known_devices.shm"),
+        ttl=KNOWN_DEVICE_TTL,
+        max_devices=KNOWN_DEVICE_MAX_PER_MEMBER,
+    )
+else:
+    known_devices = SQLiteKnownDeviceStore(
+        os.getenv("KNOWN_DEVICE_DB", "known_devices.db"),
+        ttl=KNOWN_DEVICE_TTL,
+        max_devices=KNOWN_DEVICE_MAX_PER_MEMBER,
+    )
+known_devices.purge_expired()
+atexit.register(known_devices.close)
+
+# Post-authentication side effects run off the response path on BACKGROUND_WORKERS
+# threads, with at most BACKGROUND_QUEUE_SIZE tasks waiting (0 workers runs them inline)
+# Registered after known_devices.close so queued enrollments finish before the store closes
+background = BackgroundQueue(
+    workers=int(os.getenv("BACKGROUND_WORKERS", "4")),
+    max_pending=int(os.getenv("BACKGROUND_QUEUE_SIZE", "1000")),
+)
+atexit.register(background.shutdown)
+REGISTRY.register_callback(
+    "background_tasks",
+    "Background queue: tasks pending, completed, failed, and ran_inline when the queue was full",
+    lambda: {(("state", k),): v for k, v in background.stats().items()},
+)
+
+# Long-lived signed cookie naming the VisitorFingerprint last verified on this browser,
+# only read while DFP lookups are unavailable (see DFP_DEGRADED_POLICY)
+KNOWN_DEVICE_COOKIE = "known_device"
+known_device_signer = itsdangerous.URLSafeSerializer(
+    app.secret_key, salt="known-device"
+)
+
+# Set PREWARM_UPSTREAM to "true" to load the Stytch client and open PREWARM_CONNECTIONS
+# connections each to the Stytch and DFP APIs in the background at startup
+# /readyz only reports ready once that's done, so the first requests find warm pools
+PREWARM_UPSTREAM = os.getenv("PREWARM_UPSTREAM", "false").lower() == "true"
+PREWARM_CONNECTIONS = int(os.getenv("PREWARM_CONNECTIONS", "4"))
+upstream_ready = threading.Event()
+
+
+def prewarm_upstream():
+    start = time.perf_counter()
+    try:
+        client = stytch_client.get()
+    except Exception:
+        logger.exception("Unable to load the Stytch client")
+        return
+    warm_connections(stytch_session, client.api_base.base_url, PREWARM_CONNECTIONS)
+    warm_connections(dfp_client.session, dfp_client.lookup_url, PREWARM_CONNECTIONS)
+    upstream_ready.set()
+    logger.info("Upstream clients warmed in %.2fs", time.perf_counter() - start)
+
+
+if PREWARM_UPSTREAM:
+    threading.Thread(target=prewarm_upstream, name="prewarm", daemon=True).start()
+else:
+    upstream_ready.set()
 
 
 @app.route("/")
 def index():
     member, organization = get_authenticated_member_and_organization()
     if member and organization:
+        organization = organization_settings(organization.organization_id) or organization
         logger.info("Active Session Found")
         logger.info(
-            f"Session Member -- {member.email_address} | {member.member_id} \nSession Org -- {organization.organization_name} | {organization.organization_id}"
+            "Session Member -- %s | %s \nSession Org -- %s | %s",
+            member.email_address,
+            member.member_id,
+            organization.organization_name,
+            organization.organization_id,
         )
-        known_devices_for_member = known_devices.get(member.member_id)
-        logger.info(f"Known Member Devices: {known_devices_for_member}")
+        known_devices_for_member = known_devices.devices(member.member_id)
+        # The full list can run to thousands of fingerprints, so it's only logged at DEBUG
+        logger.info("Known Member Devices: %d", len(known_devices_for_member))
+        logger.debug("Known Member Devices: %s", known_devices_for_member)
         return render_template(
             "loggedIn.html",
             member=member,
@@ -73,7 +454,9 @@ def index():
 
 @app.route("/logout")
 def logout():
-    session.pop("stytch_session_token", None)
+    session_token = session.pop("stytch_session_token", None)
+    if session_auth_cache is not None and session_token:
+        session_auth_cache.invalidate(session_token)
     return redirect(url_for("index"))
 
 
@@ -92,11 +475,17 @@ def send_eml():
     # Use DFP lookup response to proactively block fraudulent traffic from attempting to login
     telemetry_id = request.headers.get("X-Telemetry-ID", "")
     data = fingerprint_lookup(telemetry_id)
+    if data is None and dfp_client.degraded:
+        # Any Member enrolled in adaptive MFA is still challenged per DFP_DEGRADED_POLICY
+        logger.warning("DFP lookups unavailable, sending magic link without a verdict.")
+        data = {"verdict": {"action": "DEGRADED"}}
     if data is None:
         logger.error("DFP Lookup of TelemetryID failed.")
         return redirect(url_for("oops"))
 
-    verdict_action = data.get("verdict", {}).get("action", "")
+    verdict_action, visitor_fingerprint = adaptive_mfa.lookup_fields(data)
+    dfp_verdicts.inc(action=verdict_action or "NONE")
+    reputation.observe(visitor_fingerprint, email.lower(), verdict_action)
     if verdict_action == "BLOCK":
         logger.info(
             "DFP Verdict Action is BLOCK -- returning success page to obfuscate fingerprint block"
@@ -140,6 +529,11 @@ def authenticate():
     # The intermediate_session_token (IST) allows you to persist authentication state
     # while you present the user with the Organizations they can log into, or the option to create a new Organization
     session["ist"] = resp.intermediate_session_token
+    rotate_session_id()
+    discovered_orgs_cache.set(
+        resp.intermediate_session_token,
+        index_discovered_organizations(resp.discovered_organizations),
+    )
     orgs = []
     for discovered in resp.discovered_organizations:
         org = {
@@ -184,8 +578,9 @@ def create_organization():
 
     # New Organizations have an OPTIONAL MFA Policy by default
     # Set the Member's session in cookies and prompt them to enroll in MFA
-    session.pop("ist")
+    pop_ist()
     session["stytch_session_token"] = resp.session_token
+    rotate_session_id()
     return redirect(url_for("enroll_mfa_prompt"))
 
 
@@ -195,9 +590,24 @@ def create_organization():
 # You will exchange the IST returned from the discovery.authenticate() method call
 # to complete the login process
 @app.route("/exchange/<string:organization_id>", methods=["POST"])
-def exchange_into_organization(organization_id):
+async def exchange_into_organization(organization_id):
 
-    discovered_organization = get_discovered_organization(organization_id)
+    # The discovered Organization and the Organization's settings are fetched at once
+    # The DFP lookup is a paid call only used for Members going through adaptive MFA,
+    # so it only joins them when what's already cached (the discovered Organizations
+    # are, after a magic link login) shows this Member will need it
+    telemetry_id = request.headers.get("X-Telemetry-ID", "")
+    calls = [
+        lambda: get_discovered_organization(organization_id),
+        lambda: organization_settings(organization_id),
+    ]
+    cached_discovered_orgs = discovered_orgs_cache.peek(session.get("ist"))
+    cached_discovered_organization = (cached_discovered_orgs or {}).get(organization_id)
+    if cached_discovered_organization is not None and uses_adaptive_mfa(
+        cached_discovered_organization, org_settings_cache.peek(organization_id)
+    ):
+        calls.append(lambda: fingerprint_lookup(telemetry_id))
+    discovered_organization, organization, *looked_up = await upstream.gather(*calls)
     if discovered_organization is None:
         logger.info(
             "Discovered organization not found, unable to exchange into Organization"
@@ -206,9 +616,8 @@ def exchange_into_organization(organization_id):
 
     member = discovered_organization.membership.member
 
-    if (
-        not discovered_organization.member_authenticated
-        and discovered_organization.mfa_required
+    if not discovered_organization.member_authenticated and mfa_required(
+        discovered_organization, organization
     ):
         logger.info(
             "Organization MFA Policy is REQUIRED_FOR_ALL. User is required to complete MFA regardless of device."
@@ -219,7 +628,8 @@ def exchange_into_organization(organization_id):
     # Prompt to enroll in adaptive MFA
     if discovered_organization.membership.type == "eligible_to_join_by_email_domain":
         logger.info(
-            f"JIT Provisioning into OrgID: {discovered_organization.organization.organization_id}"
+            "JIT Provisioning into OrgID: %s",
+            discovered_organization.organization.organization_id,
         )
         ist = session.get("ist", None)
         try:
@@ -232,6 +642,7 @@ def exchange_into_organization(organization_id):
                 f"Unable to exchange IST for Org Session when JIT Provisioning: {e.details}"
             )
             return redirect(url_for("oops"))
+        discovered_orgs_cache.invalidate(ist)
 
         return redirect(url_for("enroll_mfa_prompt"))
 
@@ -243,25 +654,57 @@ def exchange_into_organization(organization_id):
 
     # Handle case where member is enrolled in adaptive MFA
     # First check to see if current device is a known device for the member
-    telemetry_id = request.headers.get("X-Telemetry-ID", "")
-    data = fingerprint_lookup(telemetry_id)
+    if looked_up:
+        data = looked_up[0]
+    else:
+        data = await upstream.run(fingerprint_lookup, telemetry_id)
     if data:
-        verdict_action = data.get("verdict", {}).get("action", "")
-        visitor_fingerprint = data.get("fingerprints", {}).get(
-            "visitor_fingerprint", None
+        verdict_action, visitor_fingerprint = adaptive_mfa.lookup_fields(data)
+        dfp_verdicts.inc(action=verdict_action or "NONE")
+        reputation.observe(
+            visitor_fingerprint,
+            member.email_address.lower(),
+            verdict_action,
+            organization_id,
         )
-        known_devices_for_member = known_devices.get(member.member_id, set())
-
-        is_known_device = visitor_fingerprint in known_devices_for_member
+        is_known_device = known_devices.contains(member.member_id, visitor_fingerprint)
+        is_shared_device = reputation.is_shared(visitor_fingerprint)
+        if is_shared_device:
+            logger.warning(
+                "VisitorFingerprint %s is shared by many accounts, requiring MFA",
+                visitor_fingerprint,
+            )
+        if reputation.org_challenge_spike(organization_id):
+            logger.warning(
+                "CHALLENGE verdicts are spiking for OrgID: %s", organization_id
+            )
         # logger.info(
         #     f"VisitorFingerprint: {visitor_fingerprint} | Is Known: {is_known_device} | Verdict Action: {verdict_action}"
         # )
 
-        if is_known_device and verdict_action == "ALLOW":
+        decision = adaptive_mfa.decide(
+            verdict_action, is_known_device, is_shared_device=is_shared_device
+        )
+        if decision == adaptive_mfa.SKIP_MFA:
             logger.info(
                 "Known authentic device. Skipping MFA and exchanging IST for Session."
             )
+            known_devices.touch(member.member_id, visitor_fingerprint)
+            remember_known_device(visitor_fingerprint)
+            adaptive_mfa_decisions.inc(outcome="known_device")
+            return exchange_ist_for_org_session(organization_id)
+    elif dfp_client.degraded:
+        is_known_device = known_devices.contains(
+            member.member_id, remembered_known_device()
+        )
+        decision = adaptive_mfa.decide_degraded(is_known_device, DFP_DEGRADED_POLICY)
+        if decision == adaptive_mfa.SKIP_MFA:
+            logger.info(
+                "DFP lookups unavailable, remembered known device. Skipping MFA and exchanging IST for Session."
+            )
+            adaptive_mfa_decisions.inc(outcome="known_device_degraded")
             return exchange_ist_for_org_session(organization_id)
+        logger.info("DFP lookups unavailable. Triggering MFA per degraded policy")
     else:
         logger.info(
             "Error looking up TelemetryID. Triggering MFA since unable to verify if known device"
@@ -270,17 +713,25 @@ def exchange_into_organization(organization_id):
     logger.info(
         "Unknown or untrusted device for member enrolled in adaptive MFA. Triggering MFA."
     )
+    adaptive_mfa_decisions.inc(outcome="sms_mfa")
     ist = session.get("ist")
     if ist is None:
         logger.warning("IST or Session Token required to trigger adaptive MFA")
         return redirect(url_for("oops"))
 
     try:
-        stytch_client.otps.sms.send(
-            organization_id=organization_id,
-            member_id=member.member_id,
-            intermediate_session_token=ist,
+        sms_limiter.send(
+            member.member_id,
+            organization_id,
+            lambda: stytch_client.otps.sms.send(
+                organization_id=organization_id,
+                member_id=member.member_id,
+                intermediate_session_token=ist,
+            ),
         )
+    except SMSRateLimited as e:
+        # A code was sent recently, so let the user enter that one
+        logger.warning("Suppressed OTPS SMS Send: %s", e)
     except StytchError as e:
         logger.error(f"Unable to trigger OTPS SMS Send with IST: {e.details}")
         return redirect(url_for("oops"))
@@ -321,16 +772,29 @@ def start_mfa_enrollment():
     if member is None or organization is None:
         return redirect(url_for("index"))
     try:
-        stytch_client.otps.sms.send(
-            organization_id=organization.organization_id,
-            member_id=member.member_id,
-            mfa_phone_number=phone_number,
+        sms_limiter.send(
+            member.member_id,
+            organization.organization_id,
+            lambda: stytch_client.otps.sms.send(
+                organization_id=organization.organization_id,
+                member_id=member.member_id,
+                mfa_phone_number=phone_number,
+            ),
+            phone_number=phone_number,
+        )
+    except SMSRateLimited as e:
+        # A code was sent recently, so let the user enter that one
+        logger.warning(
+            "Suppressed SMS send for MFA enrollment, prompting for the last OTP sent: %s",
+            e,
         )
     except StytchError as e:
         logger.error(f"Error sending OTP for MFA enrollment: {e.details}")
         return redirect(url_for("oops"))
-
-    logger.info("SMS send successful, prompting user for OTP to complete enrollment")
+    else:
+        logger.info(
+            "SMS send successful, prompting user for OTP to complete enrollment"
+        )
     return render_template(
         "inputMFACode.html",
         public_token=STYTCH_PUBLIC_TOKEN,
@@ -342,12 +806,15 @@ def start_mfa_enrollment():
 # Authenticates the MFA code (OTP) sent via SMS
 # If verified, will mint a session for the Member and store the current
 # VisitorFingerprint in the list of KnownDevices for the MemberID
+# The response returns as soon as the session is minted, the DFP lookup, device
+# enrollment and audit record are handled by the background queue
 @app.route("/authenticate-mfa-code", methods=["POST"])
 def authenticate_mfa_code() -> str:
 
     data = request.get_json()
     code = data.get("code", None)
     organization_id = data.get("organization_id")
+    telemetry_id = request.headers.get("X-Telemetry-ID", "")
 
     ist = session.get("ist", None)
     session_token = session.get("stytch_session_token", None)
@@ -370,7 +837,7 @@ def authenticate_mfa_code() -> str:
             resp = stytch_client.otps.sms.authenticate(
                 code=code,
                 organization_id=organization_id,
-                member_id=discovered_organization.membership.member.member_id,
+                member_id=member_id,
                 intermediate_session_token=ist,
             )
         except StytchError as e:
@@ -379,8 +846,9 @@ def authenticate_mfa_code() -> str:
             )
             return redirect(url_for("oops"))
 
-        session.pop("ist")
+        pop_ist()
         session["stytch_session_token"] = resp.session_token
+        rotate_session_id()
 
     else:
         logger.info("Performing MFA authentication for enrollment")
@@ -398,7 +866,7 @@ def authenticate_mfa_code() -> str:
             resp = stytch_client.otps.sms.authenticate(
                 code=code,
                 organization_id=organization_id,
-                member_id=member.member_id,
+                member_id=member_id,
                 session_token=session_token,
             )
         except StytchError as e:
@@ -408,20 +876,40 @@ def authenticate_mfa_code() -> str:
             return redirect(url_for("oops"))
 
         session["stytch_session_token"] = resp.session_token
+        rotate_session_id()
 
-    # Lookup the VisitorFingerprint and add to known devices for MemberID
-    telemetry_id = request.headers.get("X-Telemetry-ID", "")
-    data = fingerprint_lookup(telemetry_id)
-    if data is None:
+    # If the exchange's lookup is still cached the device can be remembered right
+    # away, otherwise the known-device cookie is set on its next known-device login
+    _, visitor_fingerprint = adaptive_mfa.lookup_fields(dfp_cache.get(telemetry_id))
+    remember_known_device(visitor_fingerprint)
+    background.submit(enroll_device, member_id, organization_id, telemetry_id)
+
+    return redirect(url_for("index"))
+
+
+# Background task adding the looked up VisitorFingerprint to known devices for
+# MemberID after successful MFA, and recording the MFA in the audit log
+def enroll_device(member_id: str, organization_id: str, telemetry_id: str):
+    _, visitor_fingerprint = adaptive_mfa.lookup_fields(fingerprint_lookup(telemetry_id))
+    if visitor_fingerprint is None:
         logger.info(
             "Lookup of TelemetryID failed, unable to add device to known devices"
         )
-        return redirect(url_for("index"))
-
-    visitor_fingerprint = data.get("fingerprints", {}).get("visitor_fingerprint", None)
-    known_devices.setdefault(member_id, set()).add(visitor_fingerprint)
-
-    return redirect(url_for("index"))
+    else:
+        known_devices.add(member_id, visitor_fingerprint)
+    # The fields are in the message for text logs and in `extra` for JSON logs
+    audit_logger.info(
+        "MFA authenticated -- member %s | organization %s | device enrolled %s",
+        member_id,
+        organization_id,
+        visitor_fingerprint is not None,
+        extra={
+            "event": "mfa_authenticated",
+            "member_id": member_id,
+            "organization_id": organization_id,
+            "device_enrolled": visitor_fingerprint is not None,
+        },
+    )
 
 
 # Example of authorized updating of Organization Settings + Just-in-Time (JIT) Provisioning
@@ -436,6 +924,9 @@ def enable_jit():
     if member is None or organization is None:
         return redirect(url_for("index"))
 
+    from stytch.b2b.models.organizations import UpdateRequestOptions
+    from stytch.shared.method_options import Authorization
+
     # Note: not allowed for common domains like gmail.com
     domain = member.email_address.split("@")[1]
 
@@ -443,8 +934,8 @@ def enable_jit():
     # Stytch will do AuthZ enforcement based on the Session Member's RBAC permissions
     # before honoring the request
     try:
-        stytch_client.organizations.update(
-            organization_id=organization.organization_id,
+        update_organization(
+            organization.organization_id,
             email_jit_provisioning="RESTRICTED",
             email_allowed_domains=[domain],
             method_options=UpdateRequestOptions(
@@ -459,9 +950,34 @@ def enable_jit():
         )
         return redirect(url_for("oops"))
 
+    # The cached session holds the old Organization settings
+    if session_auth_cache is not None:
+        session_auth_cache.invalidate(session.get("stytch_session_token"))
+
     return redirect(url_for("index"))
 
 
+# Prometheus text exposition of the app's metrics
+# In production, restrict access to this endpoint to your monitoring system
+@app.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Liveness probe, the process is up and serving requests
+@app.route("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+# Readiness probe, 503 until the upstream clients are warm when PREWARM_UPSTREAM is set
+@app.route("/readyz")
+def readyz():
+    ready = upstream_ready.is_set()
+    body = {"ready": ready, "stytch_client_loaded": stytch_client.loaded}
+    return body, 200 if ready else 503
+
+
 @app.route("/email_sent")
 def email_sent():
     return render_template("emailSent.html")
@@ -479,25 +995,77 @@ def enroll_mfa_prompt():
 
 # Helper function to get the DiscoveredOrganizations object for a specified
 # OrganizationID using the user's current IST
+# Helper to tell whether the Member must complete MFA to log into the Organization
+# The discovered Organization is cached per IST and may predate a policy change, so
+# the current MFA policy comes from the Organization's settings when they're known
+def mfa_required(discovered_organization, organization):
+    if organization is None:
+        return discovered_organization.mfa_required
+    return (
+        organization.mfa_policy == "REQUIRED_FOR_ALL"
+        or discovered_organization.membership.member.mfa_enrolled
+    )
+
+
+# Helper to tell whether a login goes through adaptive MFA, the only path that uses
+# the DFP lookup: MFA isn't required, the Member isn't joining by JIT provisioning,
+# and has a phone number enrolled
+def uses_adaptive_mfa(discovered_organization, organization):
+    if not discovered_organization.member_authenticated and mfa_required(
+        discovered_organization, organization
+    ):
+        return False
+    if discovered_organization.membership.type == "eligible_to_join_by_email_domain":
+        return False
+    return bool(discovered_organization.membership.member.mfa_phone_number)
+
+
 def get_discovered_organization(organization_id):
     ist = session.get("ist", None)
     if ist is None:
         logger.warning("IST not found, unable to fetch discovered organization")
         return None
     try:
-        resp = stytch_client.discovery.organizations.list(
-            intermediate_session_token=ist
+        discovered_orgs = discovered_orgs_cache.get_or_load(
+            ist, lambda: list_discovered_organizations(ist)
         )
     except StytchError as e:
         logger.error(f"Error fetching discovered organizations by IST: {e.details}")
         return None
 
-    for discovered_org in resp.discovered_organizations:
-        if discovered_org.organization.organization_id == organization_id:
-            return discovered_org
+    # OrgID passed not found in discovered organizations for IST returns None
+    return discovered_orgs.get(organization_id)
+
+
+def list_discovered_organizations(ist):
+    resp = stytch_client.discovery.organizations.list(intermediate_session_token=ist)
+    return index_discovered_organizations(resp.discovered_organizations)
+
+
+# Helper to key a list of DiscoveredOrganizations by OrganizationID
+def index_discovered_organizations(discovered_organizations):
+    return {
+        discovered_org.organization.organization_id: discovered_org
+        for discovered_org in discovered_organizations
+    }
 
-    # OrgID passed not found in discovered organizations for IST
-    return None
+
+# Helper to discard the IST once it has been exchanged, along with its cached
+# discovered Organizations
+def pop_ist():
+    ist = session.pop("ist", None)
+    if ist is not None:
+        discovered_orgs_cache.invalidate(ist)
+    return ist
+
+
+# Helper to give a server-side session a new ID once it holds an IST or session token,
+# so that a session ID fixed before login can't be used after it
+# Signed-cookie sessions carry their data in the cookie and need no rotation
+def rotate_session_id():
+    regenerate = getattr(session, "regenerate", None)
+    if regenerate is not None:
+        regenerate()
 
 
 # Helper to retrieve the authenticated Member and Organization context
@@ -507,9 +1075,10 @@ def get_authenticated_member_and_organization():
         return None, None
 
     try:
-        resp = stytch_client.sessions.authenticate(session_token=stytch_session)
+        resp = authenticate_session(stytch_session)
         # Remember to reset the cookie session, as sessions.authenticate() will issue a new token
-        session["stytch_session_token"] = resp.session_token
+        if resp.session_token != stytch_session:
+            session["stytch_session_token"] = resp.session_token
         return resp.member, resp.organization
     except StytchError as e:
         if e.details.error_type == "session_not_found":
@@ -519,18 +1088,96 @@ def get_authenticated_member_and_organization():
         return None, None
 
 
-# Helper to get the lookup data for a given TelemetryID
-def fingerprint_lookup(telemetry_id: str):
-    lookup_url = f"https://telemetry.stytch.com/v1/fingerprint/lookup?telemetry_id={telemetry_id}"
-    auth = (STYTCH_PROJECT_ID, STYTCH_SECRET)
+# Helper to get an Organization's settings, from the cache when possible
+def organization_settings(organization_id):
+    try:
+        return org_settings_cache.get_or_load(
+            organization_id,
+            lambda: stytch_client.organizations.get(
+                organization_id=organization_id
+            ).organization,
+        )
+    except StytchError as e:
+        logger.error("Error fetching Organization settings: %s", e.details)
+        return None
 
-    resp = requests.get(lookup_url, auth=auth)
-    if resp.status_code != 200:
-        error_message = str(resp.json()).replace("\r\n", "").replace("\n", "")
-        logger.error(f"Error looking up TelemetryID: {error_message}")
+
+# Helper to update an Organization's settings with Stytch and write the updated
+# settings through to the cache
+# Use this for every Organization update so cached settings are never stale
+def update_organization(organization_id, **fields):
+    resp = stytch_client.organizations.update(organization_id=organization_id, **fields)
+    org_settings_cache.set(organization_id, resp.organization)
+    return resp
+
+
+# Helper to collect the counters of every in-process cache for /metrics
+def cache_events():
+    caches = {
+        "dfp": dfp_cache,
+        "discovered_orgs": discovered_orgs_cache,
+        "org_settings": org_settings_cache,
+    }
+    if session_auth_cache is not None:
+        caches["session_auth"] = session_auth_cache
+    events = {}
+    for name, cache in caches.items():
+        for event, value in cache.stats().items():
+            events[(("cache", name), ("event", event))] = value
+    return events
+
+
+# Helper to authenticate a session token with Stytch, reusing a recently cached
+# result when SESSION_AUTH_CACHE_TTL is set
+# A fresh response also seeds the org settings cache with the session's Organization,
+# so the dashboard doesn't fetch it again. It is only added when nothing is cached, as
+# an update_organization() may have finished after Stytch built the response
+def authenticate_session(session_token: str):
+    def authenticate():
+        resp = stytch_client.sessions.authenticate(session_token=session_token)
+        org_settings_cache.add(resp.organization.organization_id, resp.organization)
+        return resp
+
+    if session_auth_cache is None:
+        return authenticate()
+
+    resp = session_auth_cache.get_or_load(session_token, authenticate)
+    if resp.session_token != session_token:
+        session_auth_cache.set(resp.session_token, resp)
+    return resp
+
+
+# Helper to set the known-device cookie on the response to the current request
+def remember_known_device(visitor_fingerprint: str):
+    if not visitor_fingerprint:
+        return
+
+    @after_this_request
+    def set_known_device_cookie(response):
+        response.set_cookie(
+            KNOWN_DEVICE_COOKIE,
+            known_device_signer.dumps(visitor_fingerprint),
+            max_age=int(KNOWN_DEVICE_TTL),
+            httponly=True,
+            samesite="Lax",
+        )
+        return response
+
+
+# Helper to get the VisitorFingerprint from the known-device cookie, or None
+def remembered_known_device():
+    cookie = request.cookies.get(KNOWN_DEVICE_COOKIE)
+    if not cookie:
         return None
+    try:
+        return known_device_signer.loads(cookie)
+    except itsdangerous.BadSignature:
+        return None
+
 
-    return resp.json()
+# Helper to get the lookup data for a given TelemetryID
+def fingerprint_lookup(telemetry_id: str):
+    return dfp_cache.get_or_load(telemetry_id, lambda: dfp_client.lookup(telemetry_id))
 
 
 # Helper for exchanging the Intermediate Session Token (IST)
@@ -552,8 +1199,9 @@ def exchange_ist_for_org_session(organization_id):
         return redirect(url_for("oops"))
 
     # Set new stytch_session_token and discard IST if relevant
-    session.pop("ist")
+    pop_ist()
     session["stytch_session_token"] = resp.session_token
+    rotate_session_id()
     return redirect(url_for("index"))
 
 
@@ -0,0 +1,193 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Latency buckets in seconds, from 5ms up to 10s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Holds every metric and renders them in the Prometheus text exposition format
+# Setting enabled to False turns every observe()/inc() into a no-op
+class Registry:
+    def __init__(self):
+        self.enabled = True
+        self._metrics = []
+        self._callbacks = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    # Registers a gauge whose values are read at scrape time from fn(),
+    # which returns {labels dict as a tuple of pairs: value}
+    def register_callback(self, name: str, documentation: str, fn):
+        self._callbacks.append((name, documentation, fn))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, documentation, fn in self._callbacks:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in fn().items():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+# Monotonic counter with optional labels, e.g. counter.inc(action="ALLOW")
+class Counter:
+    def __init__(self, name: str, documentation: str, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        for key, value in self.snapshot().items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+# Cumulative latency histogram with optional labels, e.g. histogram.observe(0.2, route="/")
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets=DEFAULT_BUCKETS,
+        registry=REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.registry = registry
+        self._series = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One count per bucket plus +Inf, then the running sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    # Returns {labels: (cumulative bucket counts, count, sum)}
+    def snapshot(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+
+        result = {}
+        for key, values in series.items():
+            cumulative = []
+            running = 0
+            for count in values[:-1]:
+                running += count
+                cumulative.append(running)
+            result[key] = (cumulative, running, values[-1])
+        return result
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        for key, (cumulative, count, total) in self.snapshot().items():
+            for bound, value in zip(bounds, cumulative):
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {value}"
+                )
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+        return lines
+
+
+upstream_latency = Histogram(
+    "upstream_request_seconds", "Time spent on each upstream API call"
+)
+upstream_errors = Counter(
+    "upstream_errors_total",
+    "Upstream API calls that failed to connect or returned an error status",
+)
+
+
+# Names an upstream call after its API path, e.g. /v1/b2b/otps/sms/send -> otps.sms.send
+# Path segments that are IDs (organization-..., member-...) are dropped
+def upstream_call_name(url: str) -> str:
+    path = urlparse(url).path
+    segments = [
+        segment
+        for segment in path.strip("/").split("/")
+        if segment not in ("v1", "b2b")
+        and not segment.startswith(("organization-", "member-"))
+    ]
+    return ".".join(segments) or "unknown"
+
+
+# HTTPAdapter that records the latency and failures of every upstream call it sends
+class TimedHTTPAdapter(HTTPAdapter):
+    def send(self, request, **kwargs):
+        call = upstream_call_name(request.url)
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.RequestException:
+            upstream_errors.inc(call=call)
+            raise
+        finally:
+            upstream_latency.observe(time.perf_counter() - start, call=call)
+        if response.status_code >= 400:
+            upstream_errors.inc(call=call)
+        return response
@@ -0,0 +1,216 @@
+import contextvars
+import functools
+import hmac
+import inspect
+import itertools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# The profile of the request being handled, copied into the threads that do work for it
+_current = contextvars.ContextVar("request_profile", default=None)
+
+
+class _Profile:
+    def __init__(self, label: str):
+        self.label = label
+        self.stacks = Counter()
+        self.start = time.perf_counter()
+
+
+# Opt-in sampling profiler for individual requests
+#
+# A request is profiled when its X-Profile header matches `token` or when it is one
+# of every `sample_every` requests. While it runs, a sampler thread records the stack
+# of every thread working on it every `interval` seconds: the request thread (which
+# also opens and saves the session), the event loop thread of an async view, and the
+# upstream pool threads running its Stytch and DFP calls. Each profiled request is
+# written to `directory` as collapsed stacks (one "frame;frame;frame count" line per
+# stack, as read by flamegraph.pl and speedscope), keeping the newest `max_files`.
+#
+# Requests that aren't profiled only pay for the header check and sample count.
+# Processes forked after the profiler is created start their own sampler thread.
+class RequestProfiler:
+    def __init__(
+        self,
+        directory: str,
+        token: str = None,
+        sample_every: int = 0,
+        max_files: int = 200,
+        interval: float = 0.005,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.token = token.encode() if token else None
+        self.sample_every = sample_every
+        self.max_files = max_files
+        self.interval = interval
+        self.profiled = 0
+        self._requests = itertools.count(1)
+        self._files = itertools.count(1)
+        self._frame_names = {}
+        self._start()
+        after_fork = weakref.WeakMethod(self._start)
+        os.register_at_fork(after_in_child=lambda: after_fork() and after_fork()())
+
+    # Also runs in forked children, which inherit no sampler thread from their parent
+    def _start(self):
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        threading.Thread(target=self._sample, name="profiler", daemon=True).start()
+
+    # Profiles the app's requests, including async views and calls run on `upstream`
+    def install(self, app, upstream=None):
+        app.wsgi_app = self._wrap_wsgi_app(app.wsgi_app)
+        ensure_sync = app.ensure_sync
+
+        def ensure_sync_attached(func):
+            profile = _current.get()
+            if profile is not None and inspect.iscoroutinefunction(func):
+                func = self._attach_view(profile, func)
+            return ensure_sync(func)
+
+        app.ensure_sync = ensure_sync_attached
+        if upstream is not None:
+            upstream.wrap_call = self.wrap_call
+
+    # Wraps a call about to be handed to another thread so that thread is sampled as
+    # part of the current request's profile, if it has one
+    def wrap_call(self, fn):
+        profile = _current.get()
+        if profile is None:
+            return fn
+
+        @functools.wraps(fn)
+        def attached_call(*args, **kwargs):
+            with self._attached(profile, "upstream"):
+                return fn(*args, **kwargs)
+
+        return attached_call
+
+    def _attach_view(self, profile, view):
+        @functools.wraps(view)
+        async def attached_view(*args, **kwargs):
+            with self._attached(profile, "view"):
+                return await view(*args, **kwargs)
+
+        return attached_view
+
+    def _selected(self, environ):
+        if self.token is not None:
+            header = environ.get("HTTP_X_PROFILE")
+            if header and hmac.compare_digest(header.encode(), self.token):
+                return True
+        return self.sample_every > 0 and next(self._requests) % self.sample_every == 0
+
+    def _wrap_wsgi_app(self, wsgi_app):
+        @functools.wraps(wsgi_app)
+        def profiled_wsgi_app(environ, start_response):
+            if not self._selected(environ):
+                return wsgi_app(environ, start_response)
+            profile = _Profile(
+                f"{environ.get('REQUEST_METHOD', '')} {environ.get('PATH_INFO', '')}"
+            )
+            reset = _current.set(profile)
+            try:
+                with self._attached(profile, "request"):
+                    return wsgi_app(environ, start_response)
+            finally:
+                _current.reset(reset)
+                self._write(profile)
+
+        return profiled_wsgi_app
+
+    @contextmanager
+    def _attached(self, profile, role):
+        ident = threading.get_ident()
+        with self._lock:
+            previous = self._active.get(ident)
+            self._active[ident] = (profile, role)
+            self._wake.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if previous is None:
+                    del self._active[ident]
+                else:
+                    self._active[ident] = previous
+
+    def _frame_name(self, frame):
+        code = frame.f_code
+        name = self._frame_names.get(code)
+        if name is None:
+            module = frame.f_globals.get("__name__", "?")
+            # co_qualname is new in Python 3.11
+            qualname = getattr(code, "co_qualname", code.co_name)
+            name = self._frame_names[code] = f"{module}:{qualname}"
+        return name
+
+    def _sample(self):
+        while True:
+            self._wake.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                for ident, (profile, role) in self._active.items():
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._frame_name(frame))
+                        frame = frame.f_back
+                    stack.append(role)
+                    profile.stacks[";".join(reversed(stack))] += 1
+            del frames
+            time.sleep(self.interval)
+
+    def _write(self, profile):
+        elapsed = time.perf_counter() - profile.start
+        with self._lock:
+            stacks = list(profile.stacks.items())
+            self.profiled += 1
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", profile.label).strip("-")[:80]
+        name = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._files)}"
+            f"-{slug}-{elapsed * 1000:.0f}ms.collapsed"
+        )
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "w") as f:
+                for stack, count in stacks:
+                    f.write(f"{profile.label};{stack} {count}\n")
+            self._rotate()
+        except OSError:
+            logger.exception("Unable to write request profile")
+            return
+        logger.info("Profiled %s in %.1fms: %s", profile.label, elapsed * 1000, path)
+
+    def _rotate(self):
+        entries = [
+            entry
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(".collapsed")
+        ]
+        if len(entries) <= self.max_files:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[: len(entries) - self.max_files]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"profiled": self.profiled}
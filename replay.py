@@ -0,0 +1,143 @@
+# Replays recorded DFP lookups against the adaptive MFA decision logic to measure
+# how many SMS MFA sends a policy change would add or save
+#
+# Each line of the input JSONL file is one login by a Member enrolled in adaptive MFA:
+#   {"member_id": "member-...", "lookup": {<DFP lookup response, or null if it failed>}}
+# A record may carry "is_known_device" directly; otherwise devices are looked up
+# in the known-devices SQLite database given with --known-devices. A record may also
+# carry "is_shared_device", as the app's device reputation judged it at the time of
+# the login; a device shared by many accounts always requires MFA. Without it the
+# device is taken as not shared
+#
+# The file is streamed in batches across a process pool, so memory stays constant
+# however large it is. Records are decided independently, so devices enrolled
+# during the replayed period are not taken into account
+#
+# Usage:
+#   python replay.py lookups.jsonl --known-devices known_devices.db --trusted-actions ALLOW,CHALLENGE
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import adaptive_mfa
+
+# Set of (member_id, visitor_fingerprint) pairs, loaded once per worker process
+_known_devices = frozenset()
+
+
+def _load_known_devices(path):
+    global _known_devices
+    if path is None:
+        return
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        _known_devices = frozenset(
+            conn.execute("SELECT member_id, fingerprint FROM known_devices")
+        )
+
+
+def read_batches(path, batch_size):
+    with open(path, "rb") as f:
+        while True:
+            batch = list(itertools.islice(f, batch_size))
+            if not batch:
+                return
+            yield batch
+
+
+# Decides a batch of raw JSONL lines under the baseline and candidate policies
+def process_batch(lines, trusted_actions):
+    verdict_actions = []
+    is_known_devices = []
+    is_shared_devices = []
+    verdicts = Counter()
+    for line in lines:
+        record = json.loads(line)
+        lookup = record.get("lookup", record)
+        verdict_action, visitor_fingerprint = adaptive_mfa.lookup_fields(lookup)
+        known = record.get("is_known_device")
+        if known is None:
+            known = (record.get("member_id"), visitor_fingerprint) in _known_devices
+        verdict_actions.append(verdict_action)
+        is_known_devices.append(known)
+        is_shared_devices.append(bool(record.get("is_shared_device", False)))
+        verdicts[verdict_action if verdict_action is not None else "LOOKUP_FAILED"] += 1
+
+    baseline = Counter(
+        adaptive_mfa.decide_batch(
+            verdict_actions, is_known_devices, is_shared_devices=is_shared_devices
+        )
+    )
+    candidate = Counter(
+        adaptive_mfa.decide_batch(
+            verdict_actions, is_known_devices, trusted_actions, is_shared_devices
+        )
+    )
+    return len(lines), verdicts, baseline, candidate
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="JSONL file of recorded DFP lookups")
+    parser.add_argument("--known-devices", help="known-devices SQLite database")
+    parser.add_argument(
+        "--trusted-actions",
+        default="ALLOW",
+        help="comma separated verdict actions that let a known device skip MFA in the candidate policy",
+    )
+    parser.add_argument("--batch-size", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    trusted_actions = frozenset(
+        action.strip().upper() for action in args.trusted_actions.split(",")
+    )
+
+    total = 0
+    verdicts, baseline, candidate = Counter(), Counter(), Counter()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_load_known_devices,
+        initargs=(args.known_devices,),
+    ) as pool:
+        # Keep a bounded number of batches in flight so the file is never read ahead
+        batches = read_batches(args.path, args.batch_size)
+        pending = set()
+        for batch in itertools.islice(batches, args.workers * 2):
+            pending.add(pool.submit(process_batch, batch, trusted_actions))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                count, batch_verdicts, batch_baseline, batch_candidate = future.result()
+                total += count
+                verdicts.update(batch_verdicts)
+                baseline.update(batch_baseline)
+                candidate.update(batch_candidate)
+                batch = next(batches, None)
+                if batch is not None:
+                    pending.add(pool.submit(process_batch, batch, trusted_actions))
+    elapsed = time.perf_counter() - start
+
+    rate = total / elapsed * 60 if elapsed else 0
+    print(f"Records: {total} in {elapsed:.1f}s ({rate:,.0f} records/min)")
+    print("Verdicts: " + ", ".join(f"{k} {v}" for k, v in sorted(verdicts.items())))
+    for name, actions, counts in (
+        ("Baseline", adaptive_mfa.DEFAULT_TRUSTED_ACTIONS, baseline),
+        ("Candidate", trusted_actions, candidate),
+    ):
+        print(
+            f"{name} (trusted: {','.join(sorted(actions))}): "
+            f"skip MFA {counts[adaptive_mfa.SKIP_MFA]}, SMS MFA {counts[adaptive_mfa.SMS_MFA]}"
+        )
+    delta = candidate[adaptive_mfa.SMS_MFA] - baseline[adaptive_mfa.SMS_MFA]
+    print(f"SMS sends {'added' if delta >= 0 else 'saved'} by candidate policy: {abs(delta)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
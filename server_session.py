@@ -0,0 +1,213 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+# Session dict that remembers its server-side ID and whether its data changed
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.modified = False
+        self.previous_sid = None
+
+    # Moves the session to a fresh ID when it's saved and deletes the old one
+    # Call this whenever the session gains privileges, so that an ID planted in the
+    # browser before login can't be used to ride the authenticated session
+    def regenerate(self):
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+# Keeps session data in an in-process LRU, lost on restart and not shared between workers
+class MemorySessionStore:
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._entries[sid] = (data, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for sid in [sid for sid, (_, exp) in self._entries.items() if exp <= now]:
+                del self._entries[sid]
+
+
+# Keeps session data in a SQLite database shared by every worker on the host
+class SQLiteSessionStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._inherited = []
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)"
+        )
+        conn.commit()
+
+    # sqlite3 connections can't be shared across threads or carried across fork(),
+    # so each thread of each process gets its own. A connection inherited from the
+    # parent (e.g. opened at import under a preloading pre-fork server) is kept
+    # open but unused, since closing it would release the parent's file locks
+    def _conn(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            if getattr(local, "conn", None) is not None:
+                self._inherited.append(local.conn)
+            local.conn = None
+            local.pid = os.getpid()
+        if local.conn is None:
+            local.conn = sqlite3.connect(self.path, timeout=5.0)
+            local.conn.execute("PRAGMA synchronous=NORMAL")
+        return local.conn
+
+    def load(self, sid):
+        return (
+            self._conn()
+            .execute(
+                "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?",
+                (sid, time.time()),
+            )
+            .fetchone()
+        )
+
+    def save(self, sid, data, expires_at):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                (sid, data, expires_at),
+            )
+
+    def delete(self, sid):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def purge_expired(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+
+
+# Flask session interface that keeps session data server-side and puts only an
+# opaque session ID in the cookie
+#
+# Sessions are only written back when their data changed, or when more than
+# half of their lifetime has passed so that active sessions don't expire.
+# Expired sessions are removed in bulk every `purge_interval` seconds.
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, lifetime: float = 86400, purge_interval: float = 300):
+        self.store = store
+        self.lifetime = lifetime
+        self.purge_interval = purge_interval
+        self._next_purge = time.monotonic() + purge_interval
+        self._purge_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.store.load(sid)
+            if entry is not None:
+                data, expires_at = entry
+                return ServerSideSession(
+                    self.serializer.loads(data), sid=sid, expires_at=expires_at
+                )
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        self._maybe_purge()
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # The response depends on the session cookie, as with Flask's own interface
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.previous_sid is not None:
+            self.store.delete(session.previous_sid)
+        if not session:
+            if not session.new or session.previous_sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        stale = (
+            session.expires_at is None or session.expires_at - now < self.lifetime / 2
+        )
+        if not session.modified and not stale:
+            return
+
+        expires_at = now + self.lifetime
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), expires_at)
+        response.set_cookie(
+            name,
+            session.sid,
+            max_age=int(self.lifetime),
+            domain=domain,
+            path=path,
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def _maybe_purge(self):
+        if time.monotonic() < self._next_purge:
+            return
+        if not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = time.monotonic() + self.purge_interval
+            self.store.purge_expired()
+        finally:
+            self._purge_lock.release()
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from cache import TTLCache
+
+
+class SMSRateLimited(Exception):
+    pass
+
+
+# One shard of the token buckets, with its own lock so that threads sending
+# to different members rarely contend
+class _BucketShard:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.rate_limited = 0
+
+
+# Guards SMS OTP sends against double-clicks and retrying clients
+#
+# Sends with the same coalesce key (member, organization and phone number) within
+# `coalesce_window` seconds share a single upstream call, including sends that
+# arrive while the first is still in flight. Beyond that, each member and
+# organization pair gets a token bucket of `burst` sends refilled at
+# `rate_per_minute`, and sends without a token raise SMSRateLimited.
+class SMSSendLimiter:
+    def __init__(
+        self,
+        rate_per_minute: float = 1.0,
+        burst: int = 3,
+        coalesce_window: float = 10.0,
+        shards: int = 16,
+        max_keys: int = 100_000,
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._shards = [_BucketShard(max(1, max_keys // shards)) for _ in range(shards)]
+        self._recent = TTLCache(max_size=max_keys, ttl=coalesce_window)
+
+    def _take_token(self, key):
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                if len(shard.buckets) >= shard.max_keys:
+                    self._prune(shard, now)
+                bucket = shard.buckets[key] = [float(self.burst), now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                shard.rate_limited += 1
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    # Drops buckets that have refilled completely, they are equivalent to a new bucket
+    def _prune(self, shard, now):
+        for key, (tokens, updated) in list(shard.buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.burst:
+                del shard.buckets[key]
+
+    def send(self, member_id, organization_id, send, phone_number=None):
+        def limited_send():
+            if not self._take_token((member_id, organization_id)):
+                raise SMSRateLimited(
+                    f"SMS send rate limit reached for member {member_id}"
+                )
+            return send()
+
+        return self._recent.get_or_load(
+            (member_id, organization_id, phone_number), limited_send
+        )
+
+    def stats(self):
+        recent = self._recent.stats()
+        return {
+            "coalesced": recent["hits"] + recent["coalesced"],
+            "rate_limited": sum(shard.rate_limited for shard in self._shards),
+        }
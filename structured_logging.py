@@ -0,0 +1,167 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has, anything else on a record came from `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+# Formats each record as one JSON object per line, with any `extra=` fields included
+# The encoder and the formatted date and time of the current second are reused from
+# record to record, they were most of the cost of formatting one
+class JSONFormatter(logging.Formatter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encoder = json.JSONEncoder(default=str)
+        self._second = None
+        self._second_text = None
+
+    def _time(self, created):
+        second = int(created)
+        if second != self._second:
+            self._second_text = datetime.fromtimestamp(second, timezone.utc).strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )
+            self._second = second
+        return f"{self._second_text}.{int((created - second) * 1e6):06d}+00:00"
+
+    def format(self, record):
+        entry = {
+            "time": self._time(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return self._encoder.encode(entry)
+
+
+# Keeps only `rate` of the records below WARNING; warnings and errors are always kept
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        if random.random() < self.rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+# Hands records to the writer thread without formatting them or ever blocking
+# The stdlib QueueHandler formats each message on the calling thread so that records
+# can be pickled to other processes; the writer here is a thread in the same process,
+# so records are passed as they are and their message is only built when written.
+# When the queue is full, records are dropped rather than holding up the request.
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Writes queued records from a background thread, taking every record already waiting
+# (up to `batch_size`) and writing them to `stream` with a single write and flush
+class BatchingQueueListener:
+    def __init__(self, log_queue, handler, batch_size: int = 64):
+        self.queue = log_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._monitor, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _monitor(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines, written = [], None
+            for record in batch:
+                if record is None:
+                    stopping = True
+                elif self.handler.filter(record):
+                    try:
+                        lines.append(self.handler.format(record))
+                        written = record
+                    except Exception:
+                        self.handler.handleError(record)
+            if lines:
+                stream = self.handler.stream
+                try:
+                    stream.write("\n".join(lines) + "\n")
+                    stream.flush()
+                except Exception:
+                    self.handler.handleError(written)
+            for _ in batch:
+                self.queue.task_done()
+
+    # Writes the records still queued, then stops the writer thread
+    def stop(self):
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+
+# Sends every log record through a bounded queue to a background thread that formats
+# it as JSON and writes it to `stream` in batches, keeping `sample_rate` of the records
+# below WARNING. Records still queued are written at exit.
+# Returns the queue handler, whose filter and `dropped` count the discarded records
+def configure_json_logging(
+    level=logging.INFO, sample_rate: float = 1.0, queue_size: int = 10000, stream=None
+):
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    stream_handler.setFormatter(JSONFormatter())
+    queue_handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    listener = BatchingQueueListener(queue_handler.queue, stream_handler)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+
+    # A process forked after this (a preloading pre-fork server) inherits no writer
+    # thread, so it gets its own, with a new queue; the parent writes what it queued
+    def restart_in_child():
+        queue_handler.queue = listener.queue = queue.Queue(queue_size)
+        listener.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+    return queue_handler
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, ROOT)
+
+from stubs import StubStytchAPI, StubTelemetryAPI  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def stytch_api():
+    api = StubStytchAPI().start()
+    yield api
+    api.stop()
+
+
+@pytest.fixture(scope="session")
+def telemetry_api():
+    api = StubTelemetryAPI().start()
+    yield api
+    api.stop()
+
+
+# The app, imported once per test run and pointed at the local stub Stytch and DFP APIs
+@pytest.fixture(scope="session")
+def app_module(stytch_api, telemetry_api):
+    os.environ.update(
+        STYTCH_PROJECT_ID="project-test-00000000-0000-0000-0000-000000000000",
+        STYTCH_SECRET="secret-test-pytest",
+        STYTCH_PUBLIC_TOKEN="public-token-test-pytest",
+        ENV=f"{stytch_api.url}/",
+        DFP_LOOKUP_URL=f"{telemetry_api.url}/v1/fingerprint/lookup",
+        KNOWN_DEVICE_STORE="memory",
+        KNOWN_DEVICE_MAX_PER_MEMBER="1000",
+    )
+    import main
+
+    return main
@@ -0,0 +1,29 @@
+import itertools
+
+import adaptive_mfa
+
+
+def test_decide_batch_matches_decide():
+    rows = list(
+        itertools.product(
+            ("ALLOW", "CHALLENGE", "BLOCK", "", None), (True, False), (True, False)
+        )
+    )
+    actions, known, shared = zip(*rows)
+    for trusted in (
+        adaptive_mfa.DEFAULT_TRUSTED_ACTIONS,
+        frozenset(["ALLOW", "CHALLENGE"]),
+    ):
+        assert adaptive_mfa.decide_batch(actions, known, trusted, shared) == [
+            adaptive_mfa.decide(a, k, trusted, is_shared_device=s) for a, k, s in rows
+        ]
+
+
+def test_decide_batch_shared_device_requires_mfa():
+    assert adaptive_mfa.decide_batch(["ALLOW", "ALLOW"], [True, True]) == [
+        adaptive_mfa.SKIP_MFA,
+        adaptive_mfa.SKIP_MFA,
+    ]
+    assert adaptive_mfa.decide_batch(
+        ["ALLOW", "ALLOW"], [True, True], is_shared_devices=[False, True]
+    ) == [adaptive_mfa.SKIP_MFA, adaptive_mfa.SMS_MFA]
@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+from background import BackgroundQueue
+from stubs import MEMBER_ID, ORGANIZATION_ID
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+@pytest.fixture
+def background():
+    queue = BackgroundQueue(workers=2)
+    yield queue
+    queue.shutdown()
+
+
+def test_submit_returns_before_task_runs(background):
+    release = threading.Event()
+    done = []
+    background.submit(lambda: (release.wait(5), done.append(threading.get_ident())))
+    assert done == []
+    release.set()
+    assert wait_for(lambda: done)
+    assert done[0] != threading.get_ident()
+    assert wait_for(lambda: background.stats()["completed"] == 1)
+
+
+def test_shutdown_runs_every_queued_task():
+    queue = BackgroundQueue(workers=1, max_pending=100)
+    release = threading.Event()
+    done = []
+    queue.submit(release.wait, 5)
+    for i in range(50):
+        queue.submit(done.append, i)
+    assert queue.stats()["pending"] > 0
+    release.set()
+    queue.shutdown()
+    assert done == list(range(50))
+    assert queue.stats() == {"pending": 0, "completed": 51, "failed": 0, "ran_inline": 0}
+
+
+def test_full_queue_runs_task_inline():
+    queue = BackgroundQueue(workers=1, max_pending=1, put_timeout=0.01)
+    release = threading.Event()
+    started = threading.Event()
+    queue.submit(lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    queue.submit(lambda: None)
+    ran_on = []
+    queue.submit(lambda: ran_on.append(threading.get_ident()))
+    assert ran_on == [threading.get_ident()]
+    assert queue.stats()["ran_inline"] == 1
+    release.set()
+    queue.shutdown()
+    assert queue.stats()["completed"] == 3
+
+
+def test_failed_task_is_counted_and_worker_keeps_going(caplog):
+    queue = BackgroundQueue(workers=1)
+    done = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with caplog.at_level(logging.ERROR, logger="background"):
+        queue.submit(fail)
+        queue.submit(done.append, 1)
+        queue.shutdown()
+    assert done == [1]
+    assert queue.stats()["failed"] == 1
+    assert "Background task fail failed" in caplog.text
+
+
+def test_without_workers_or_after_shutdown_tasks_run_inline():
+    for queue in (BackgroundQueue(workers=0), BackgroundQueue(workers=1)):
+        queue.shutdown()
+        done = []
+        queue.submit(done.append, 1)
+        assert done == [1]
+
+
+def test_enrolled_device_becomes_known(app_module, background, monkeypatch):
+    monkeypatch.setattr(app_module, "background", background)
+    client = app_module.app.test_client()
+    telemetry_id = str(uuid.uuid4())
+    with client.session_transaction() as sess:
+        sess["ist"] = f"ist-{telemetry_id}"
+    resp = client.post(
+        "/authenticate-mfa-code",
+        json={"code": "123456", "organization_id": ORGANIZATION_ID},
+        headers={"X-Telemetry-ID": telemetry_id},
+    )
+    assert resp.headers["Location"] == "/"
+    assert wait_for(
+        lambda: app_module.known_devices.contains(MEMBER_ID, f"vfp-{telemetry_id}")
+    )
+    assert background.stats()["completed"] == 1
+
+
+def test_no_enrollment_lost_on_shutdown(app_module, telemetry_api, monkeypatch):
+    monkeypatch.setattr(telemetry_api, "latency", 0.02)
+    queue = BackgroundQueue(workers=2)
+    member_id = f"member-test-{uuid.uuid4()}"
+    telemetry_ids = [str(uuid.uuid4()) for _ in range(20)]
+    for telemetry_id in telemetry_ids:
+        queue.submit(app_module.enroll_device, member_id, ORGANIZATION_ID, telemetry_id)
+    assert queue.stats()["pending"] > 0
+    queue.shutdown()
+    assert queue.stats()["completed"] == len(telemetry_ids)
+    for telemetry_id in telemetry_ids:
+        assert app_module.known_devices.contains(member_id, f"vfp-{telemetry_id}")
+
+
+def test_failed_lookup_enrolls_nothing_but_is_audited(
+    app_module, telemetry_api, monkeypatch, caplog
+):
+    monkeypatch.setattr(telemetry_api, "fault_rate", 1.0)
+    member_id = f"member-test-{uuid.uuid4()}"
+    with caplog.at_level(logging.INFO, logger="audit"):
+        app_module.enroll_device(member_id, ORGANIZATION_ID, "telemetry-id")
+    assert app_module.known_devices.devices(member_id) == []
+    (record,) = [r for r in caplog.records if r.name == "audit"]
+    assert record.member_id == member_id
+    assert record.device_enrolled is False
+    assert record.getMessage() == (
+        f"MFA authenticated -- member {member_id} | organization {ORGANIZATION_ID} "
+        "| device enrolled False"
+    )
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_process_runs_tasks_in_background():
+    queue = BackgroundQueue(workers=1)
+    pid = os.fork()
+    if pid == 0:
+        ran_on = []
+        queue.submit(lambda: ran_on.append(threading.get_ident()))
+        ok = wait_for(lambda: ran_on) and ran_on[0] != threading.get_ident()
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    queue.shutdown()
+    assert os.waitstatus_to_exitcode(status) == 0
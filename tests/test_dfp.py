@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+import dfp
+from circuit_breaker import CLOSED, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def lookup_url(telemetry_api):
+    return f"{telemetry_api.url}/v1/fingerprint/lookup"
+
+
+def test_late_backoff_sleep_gives_up_at_deadline(
+    lookup_url, telemetry_api, monkeypatch
+):
+    monkeypatch.setattr(telemetry_api, "fault_rate", 1.0)
+    sleep = time.sleep
+    monkeypatch.setattr(dfp.time, "sleep", lambda seconds: sleep(seconds + 0.06))
+    breaker = CircuitBreaker(failure_threshold=1)
+    client = dfp.FingerprintLookupClient(
+        "project", "secret", lookup_url=lookup_url, deadline=0.35, breaker=breaker
+    )
+    assert client.lookup("telemetry-id") is None
+    assert breaker.state == OPEN
+
+
+def test_unexpected_error_still_records_outcome(lookup_url, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1)
+    client = dfp.FingerprintLookupClient(
+        "project", "secret", lookup_url=lookup_url, breaker=breaker
+    )
+
+    def fail(telemetry_id):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(client, "_lookup", fail)
+    with pytest.raises(ValueError):
+        client.lookup("telemetry-id")
+    assert breaker.state == OPEN
+
+
+@pytest.mark.parametrize("deadline", [0, -1])
+def test_non_positive_deadline_means_none(lookup_url, deadline):
+    breaker = CircuitBreaker()
+    client = dfp.FingerprintLookupClient(
+        "project", "secret", lookup_url=lookup_url, deadline=deadline, breaker=breaker
+    )
+    assert client.deadline is None
+    assert client.lookup("telemetry-id") is not None
+    assert breaker.state == CLOSED
@@ -0,0 +1,43 @@
+import uuid
+
+import pytest
+
+from stubs import ORGANIZATION_ID
+
+LOOKUP_PATH = "/v1/fingerprint/lookup"
+
+
+@pytest.fixture
+def exchange(app_module, telemetry_api):
+    client = app_module.app.test_client()
+
+    # Posts an exchange into the Organization for a new IST, with its discovered
+    # Organizations cached or not, and returns the number of DFP lookups it made
+    def exchange(cached=True, phone_number=None):
+        ist = f"ist-{uuid.uuid4()}"
+        with client.session_transaction() as sess:
+            sess["ist"] = ist
+        if cached:
+            discovered_orgs = app_module.list_discovered_organizations(ist)
+            if phone_number is not None:
+                member = discovered_orgs[ORGANIZATION_ID].membership.member
+                member.mfa_phone_number = phone_number
+            app_module.discovered_orgs_cache.set(ist, discovered_orgs)
+        before = telemetry_api.paths[LOOKUP_PATH]
+        resp = client.post(
+            f"/exchange/{ORGANIZATION_ID}",
+            headers={"X-Telemetry-ID": str(uuid.uuid4())},
+        )
+        assert resp.status_code == 302
+        return telemetry_api.paths[LOOKUP_PATH] - before
+
+    return exchange
+
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_adaptive_mfa_member_is_looked_up_once(exchange, cached):
+    assert exchange(cached=cached) == 1
+
+
+def test_member_without_phone_number_is_not_looked_up(exchange):
+    assert exchange(phone_number="") == 0
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from cache import TTLCache
+from stubs import ORGANIZATION, ORGANIZATION_ID
+
+ORGANIZATION_PATH = f"/v1/b2b/organizations/{ORGANIZATION_ID}"
+
+
+@pytest.fixture
+def app(app_module):
+    saved = dict(ORGANIZATION)
+    app_module.org_settings_cache.clear()
+    yield app_module
+    ORGANIZATION.clear()
+    ORGANIZATION.update(saved)
+    app_module.org_settings_cache.clear()
+
+
+def logged_in_client(app):
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess["stytch_session_token"] = "session-token-org-settings"
+    return client
+
+
+def test_set_discards_load_in_flight():
+    cache = TTLCache()
+    loading = threading.Event()
+    release = threading.Event()
+    loaded = []
+
+    def load():
+        loading.set()
+        release.wait(5)
+        return "before update"
+
+    reader = threading.Thread(
+        target=lambda: loaded.append(cache.get_or_load("org", load))
+    )
+    reader.start()
+    assert loading.wait(5)
+    cache.set("org", "after update")
+    release.set()
+    reader.join()
+    assert loaded == ["before update"]
+    assert cache.get("org") == "after update"
+
+
+def test_add_only_fills_missing_entries():
+    cache = TTLCache()
+    cache.add("org", "seeded")
+    assert cache.get("org") == "seeded"
+    cache.set("org", "updated")
+    cache.add("org", "older response")
+    assert cache.get("org") == "updated"
+
+
+def test_update_is_read_back(app, stytch_api):
+    assert app.organization_settings(ORGANIZATION_ID).organization_name == "Example Org"
+    app.update_organization(ORGANIZATION_ID, organization_name="Renamed Org")
+    gets = stytch_api.paths[ORGANIZATION_PATH]
+    assert app.organization_settings(ORGANIZATION_ID).organization_name == "Renamed Org"
+    assert stytch_api.paths[ORGANIZATION_PATH] == gets
+
+
+def test_dashboard_seeds_settings_from_session(app, stytch_api):
+    client = logged_in_client(app)
+    before = stytch_api.paths[ORGANIZATION_PATH]
+    assert "Example Org" in client.get("/").text
+    assert stytch_api.paths[ORGANIZATION_PATH] == before
+    assert app.org_settings_cache.get(ORGANIZATION_ID).organization_name == "Example Org"
+
+
+def test_dashboard_shows_update(app):
+    client = logged_in_client(app)
+    assert "JIT Provisioning Allowed" not in client.get("/").text
+    client.get("/enable_jit")
+    assert "JIT Provisioning Allowed" in client.get("/").text
@@ -0,0 +1,55 @@
+import os
+import time
+import types
+
+import pytest
+
+from profiler import RequestProfiler
+
+
+def slow_app(environ, start_response):
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return [b""]
+
+
+def profile_request(profiler):
+    app = profiler._wrap_wsgi_app(slow_app)
+    app({"REQUEST_METHOD": "GET", "PATH_INFO": "/", "HTTP_X_PROFILE": "secret"}, None)
+    (path,) = [
+        os.path.join(profiler.directory, name)
+        for name in os.listdir(profiler.directory)
+        if name.endswith(".collapsed")
+    ]
+    with open(path) as f:
+        return f.read()
+
+
+def test_profiled_request_has_samples(tmp_path):
+    profile = profile_request(RequestProfiler(str(tmp_path), token="secret"))
+    assert "test_profiler:slow_app" in profile
+
+
+def test_frame_name_without_qualname(tmp_path):
+    # Code objects have no co_qualname before Python 3.11
+    class Code:
+        co_name = "view"
+
+    code = Code()
+    frame = types.SimpleNamespace(f_code=code, f_globals={"__name__": "main"})
+    assert RequestProfiler(str(tmp_path))._frame_name(frame) == "main:view"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_process_samples_requests(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), token="secret")
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = "test_profiler:slow_app" in profile_request(profiler)
+        except BaseException:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
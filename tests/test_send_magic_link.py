@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.mark.parametrize(
+    "verdict, sends", [("ALLOW", 1), ("CHALLENGE", 1), ("BLOCK", 0)]
+)
+def test_block_verdict_skips_send_but_looks_sent(
+    app_module, stytch_api, telemetry_api, monkeypatch, verdict, sends
+):
+    monkeypatch.setattr(telemetry_api, "pick_verdict", lambda: verdict)
+    path = "/v1/b2b/magic_links/email/discovery/send"
+    before = stytch_api.paths[path]
+    resp = app_module.app.test_client().post(
+        "/send_magic_link",
+        json={"email": "ada@example.com"},
+        headers={"X-Telemetry-ID": f"telemetry-{verdict}"},
+    )
+    assert resp.headers["Location"] == "/email_sent"
+    assert stytch_api.paths[path] - before == sends
@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+import time
+
+import pytest
+
+from structured_logging import configure_json_logging
+
+
+@pytest.fixture
+def json_log(tmp_path):
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    path = tmp_path / "log.jsonl"
+    with open(path, "w") as stream:
+        queue_handler = configure_json_logging(stream=stream)
+        yield queue_handler, path
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def read_messages(path):
+    with open(path) as f:
+        return [json.loads(line)["message"] for line in f]
+
+
+def test_records_are_written_as_json(json_log):
+    queue_handler, path = json_log
+    logging.getLogger("test").info("member %s", "m-1", extra={"member_id": "m-1"})
+    queue_handler.queue.join()
+    with open(path) as f:
+        (entry,) = [json.loads(line) for line in f]
+    assert entry["message"] == "member m-1"
+    assert entry["member_id"] == "m-1"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_process_writes_its_records(json_log):
+    queue_handler, path = json_log
+    pid = os.fork()
+    if pid == 0:
+        logging.getLogger("test").info("from child")
+        deadline = time.monotonic() + 5
+        while queue_handler.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        os._exit(1 if queue_handler.queue.unfinished_tasks else 0)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert read_messages(path) == ["from child"]